@@ -1,77 +1,170 @@
+import json
+import os
+import queue
 import random
+import time
+from multiprocessing import Process, Queue, RawArray, RawValue
 
-valueOfPiece = {"K": 0, "Q": 9, "R": 5, "B": 3, "N": 3, "P": 1}
-
-knightScores = [[1, 1, 1, 1, 1, 1, 1, 1],
-                [1, 2, 2, 2, 2, 2, 2, 1],
-                [1, 2, 3, 3, 3, 3, 2, 1],
-                [1, 2, 3, 4, 4, 3, 2, 1],
-                [1, 2, 3, 4, 4, 3, 2, 1],
-                [1, 2, 3, 3, 3, 3, 2, 1],
-                [1, 2, 2, 2, 2, 2, 2, 1],
-                [1, 1, 1, 1, 1, 1, 1, 1]]
-
-bishopScores = [[4, 3, 2, 1, 1, 2, 3, 4],
-                [3, 4, 3, 2, 2, 3, 4, 3],
-                [2, 3, 4, 2, 2, 4, 3, 2],
-                [1, 3, 3, 4, 4, 3, 3, 1],
-                [1, 3, 3, 4, 4, 3, 3, 1],
-                [2, 3, 4, 2, 2, 4, 3, 2],
-                [3, 4, 3, 2, 2, 3, 4, 3],
-                [4, 3, 2, 1, 1, 2, 3, 4]]
-
-queenScores = [[1, 1, 1, 3, 1, 1, 1, 1],
-               [1, 2, 2, 2, 2, 2, 2, 1],
-               [1, 4, 3, 3, 3, 3, 4, 1],
-               [1, 3, 2, 3, 3, 2, 3, 1],
-               [1, 3, 2, 3, 3, 2, 3, 1],
-               [1, 4, 3, 3, 3, 3, 4, 1],
-               [1, 2, 2, 2, 2, 2, 2, 1],
-               [1, 1, 1, 3, 1, 1, 1, 1]]
-
-rookScores = [[4, 2, 3, 4, 3, 4, 2, 4],
-              [4, 4, 4, 4, 4, 4, 4, 4],
-              [1, 1, 2, 3, 3, 2, 1, 1],
-              [1, 2, 3, 4, 4, 3, 2, 1],
-              [1, 2, 3, 4, 4, 3, 2, 1],
-              [1, 1, 2, 3, 3, 2, 1, 1],
-              [4, 4, 4, 4, 4, 4, 4, 4],
-              [4, 3, 4, 4, 4, 4, 3, 4]]
-
-whitePawnScores = [[9, 9, 9, 9, 9, 9, 9, 9],
-                   [8, 8, 8, 8, 8, 8, 8, 8],
-                   [5, 6, 7, 7, 7, 7, 6, 5],
-                   [2, 3, 3, 5, 5, 3, 3, 2],
-                   [1, 2, 3, 4, 4, 3, 2, 1],
-                   [1, 1, 2, 3, 3, 2, 1, 1],
-                   [1, 1, 1, 0, 0, 1, 1, 1],
-                   [0, 0, 0, 0, 0, 0, 0, 0]]
-
-blackPawnScores = [[0, 0, 0, 0, 0, 0, 0, 0],
-                   [1, 1, 1, 0, 0, 1, 1, 1],
-                   [1, 1, 2, 3, 3, 2, 1, 1],
-                   [1, 2, 3, 4, 4, 3, 2, 1],
-                   [2, 3, 3, 5, 5, 3, 3, 2],
-                   [5, 6, 7, 7, 7, 7, 6, 5],
-                   [8, 8, 8, 8, 8, 8, 8, 8],
-                   [9, 9, 9, 9, 9, 9, 9, 9]]
-
-kingScores = [[2, 2, 5, 1, 1, 2, 5, 2],
-             [1, 1, 1, 1, 1, 1, 1, 1],
-             [1, 1, 1, 1, 1, 1, 1, 1],
-             [1, 1, 1, 1, 1, 1, 1, 1],
-             [1, 1, 1, 1, 1, 1, 1, 1],
-             [1, 1, 1, 1, 1, 1, 1, 1],
-             [1, 1, 1, 1, 1, 1, 1, 1],
-             [2, 2, 5, 1, 1, 2, 5, 2]]
-
-piecePositionScores = {"N": knightScores, "R": rookScores, "Q": queenScores, "K": kingScores, "B":bishopScores, "bP":blackPawnScores, "wP":whitePawnScores}
+import ChessEngine
+import OpeningBook
+import Tablebase
+# the evaluation tables live in ChessEngine now, still importable from here
+from ChessEngine import (bishopScores, blackPawnScores, kingScores, knightScores, piecePositionScores,
+                         queenScores, rookScores, valueOfPiece, whitePawnScores)
+
+try:
+    import numpy as np
+except ImportError:  # only scoreBatch needs numpy
+    np = None
 
 CHECKMATE = 1000
 STALEMATE = 0
-DEPTH = 2
+DEPTH = 2  # depth of a search that isn't given one
+THREADS = 1  # processes a Searcher searches with, more than 1 runs a Lazy SMP search over a shared transposition table
+OPENING_BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "book.bin")
+openingBook = None  # OpeningBook findBestMove plays from before searching, opened on first use
+openingBookLoaded = False
+endgameTablebase = None  # Tablebase.Tablebase findBestMove and the search probe, opened on first use
+endgameTablebaseLoaded = False
+TABLEBASE_WIN = CHECKMATE - 1  # a tablebase win scores just under a mate on the board, less per ply it takes
 # negative value means black is winning, positive if white is winning
 
+# transposition table
+TT_SIZE_MB = 16
+EXACT, LOWER_BOUND, UPPER_BOUND = 0, 1, 2
+
+# move ordering
+ORDER_VALUE = {"P": 1, "N": 2, "B": 3, "R": 4, "Q": 5, "K": 6}  # MVV-LVA: most valuable victim, least valuable attacker
+MAX_PLY = 64
+
+# quiescence search
+DELTA_MARGIN = 2  # pawns of positional slack allowed on top of the captured piece before a capture is skipped
+PROMOTION_RANK_PAWNS = {True: ("wP", 0xFF << 8), False: ("bP", 0xFF << 48)}  # per whiteToMove: pawns one step away
+
+# principal variation search and aspiration windows, both switchable per Searcher to benchmark them against plain
+# alpha-beta
+USE_PVS = True
+USE_ASPIRATION = True
+NULL_WINDOW = 0.001  # pawns, the smallest score step the transposition table keeps (TranspositionTable.SCORE_SCALE)
+ASPIRATION_WINDOW = 0.5  # pawns either side of the previous iteration's score
+
+
+class TranspositionTable:
+    """
+    Fixed-size hash table of search results, keyed by GameState.zobristKey. Lives in shared memory so it can be
+    handed to the Process that runs findBestMove and still be filled in for the next move of the game.
+
+    Each bucket has two slots: the first keeps the deepest result (replaced only by an equal or deeper search of
+    any position, or when it is left over from an earlier move), the second always takes the newest result.
+    An entry is one packed 64-bit word (depth, bound, age, best move id, score) plus the key xored with that word,
+    so a half-written entry never matches a probe.
+    """
+    ENTRY_BYTES = 16
+    SCORE_SCALE = 1000
+
+    def __init__(self, sizeMB=TT_SIZE_MB):
+        buckets = max(sizeMB * 1024 * 1024 // (2 * self.ENTRY_BYTES), 1)
+        buckets = 1 << (buckets.bit_length() - 1)  # power of 2 so the index is a mask
+        self.mask = buckets - 1
+        self.keys = RawArray("Q", 2 * buckets)
+        self.data = RawArray("Q", 2 * buckets)
+        self.age = RawValue("i", 0)
+
+    def newSearch(self) -> None:
+        self.age.value = (self.age.value + 1) & 0x3F
+
+    def clear(self) -> None:
+        for i in range(len(self.keys)):
+            self.keys[i] = 0
+            self.data[i] = 0
+
+    """
+    Returns (depth, score, bound, move) for the position, or None. move is the packed move code, None when no best move
+    was stored
+    """
+
+    def probe(self, key):
+        index = (key & self.mask) << 1
+        data = self.data[index]
+        if self.keys[index] ^ data != key:
+            index += 1
+            data = self.data[index]
+            if self.keys[index] ^ data != key:
+                return None
+        move = ((data >> 16) & 0xFFFF) - 1
+        return (data & 0xFF, ((data >> 32) - 0x80000000) / self.SCORE_SCALE, (data >> 8) & 0x3,
+                None if move < 0 else move)
+
+    def store(self, key, depth, score, bound, move=None) -> None:
+        index = (key & self.mask) << 1
+        age = self.age.value
+        old = self.data[index]
+        if not (self.keys[index] ^ old == key or depth >= old & 0xFF or (old >> 10) & 0x3F != age):
+            index += 1  # the depth-preferred slot holds a deeper result from this search, keep it
+        data = (depth | bound << 8 | age << 10 | (0 if move is None else move + 1) << 16 |
+                (round(score * self.SCORE_SCALE) + 0x80000000) << 32)
+        self.data[index] = data
+        self.keys[index] = key ^ data
+
+
+class SearchStats:
+    """
+    What one search did, returned by Searcher.search and kept in Searcher.stats. It is filled in as the search
+    goes, and depth, score and pv after every completed iteration, so it can be streamed one line per iteration.
+    score is in pawns for the side to move, pv the packed move codes of the expected line.
+    """
+
+    def __init__(self):
+        self.source = "search"  # or "book" / "tablebase" when the move was played without searching
+        self.depth = 0
+        self.seldepth = 0  # deepest ply reached, quiescence search included
+        self.nodes = 0  # every node searched by this process, quiescence nodes included
+        self.qnodes = 0
+        self.helperNodes = 0  # nodes of the Lazy SMP helper processes
+        self.betaCutoffs = 0
+        self.firstMoveCutoffs = 0  # cutoffs caused by the first move searched, the higher the better the ordering
+        self.ttProbes = 0
+        self.ttHits = 0
+        self.pvsResearches = 0  # moves that beat the null window and were searched again with the full one
+        self.aspirationResearches = 0  # root searches repeated because the score fell outside the aspiration window
+        self.score = None
+        self.pv = []
+        self.bestMove = None
+        self.startTime = time.perf_counter()
+        self.elapsed = 0.0
+
+    @property
+    def nps(self) -> int:
+        return int((self.nodes + self.helperNodes) / self.elapsed) if self.elapsed > 0 else 0
+
+    @property
+    def firstMoveCutoffRate(self) -> float:
+        return self.firstMoveCutoffs / self.betaCutoffs if self.betaCutoffs else 0.0
+
+    @property
+    def ttHitRate(self) -> float:
+        return self.ttHits / self.ttProbes if self.ttProbes else 0.0
+
+    def toDict(self) -> dict:
+        return {"source": self.source, "depth": self.depth, "seldepth": self.seldepth, "nodes": self.nodes,
+                "qnodes": self.qnodes, "helperNodes": self.helperNodes, "nps": self.nps,
+                "betaCutoffs": self.betaCutoffs, "firstMoveCutoffRate": round(self.firstMoveCutoffRate, 4),
+                "ttHitRate": round(self.ttHitRate, 4), "pvsResearches": self.pvsResearches,
+                "aspirationResearches": self.aspirationResearches, "elapsed": round(self.elapsed, 4),
+                "score": self.score,
+                "pv": [ChessEngine.codeNotation(move) for move in self.pv],
+                "move": None if self.bestMove is None else ChessEngine.codeNotation(self.bestMove)}
+
+    def toJson(self) -> str:
+        return json.dumps(self.toDict())
+
+    def __str__(self):
+        return (f"depth {self.depth}/{self.seldepth}  {self.nodes} nodes ({self.qnodes} quiescence)"
+                + (f" + {self.helperNodes} in helpers" if self.helperNodes else "") +
+                f"  {self.nps} nps  {self.betaCutoffs} cutoffs, {100 * self.firstMoveCutoffRate:.1f}% on the first "
+                f"move  {100 * self.ttHitRate:.1f}% tt hits  {self.elapsed:.3f}s  pv "
+                + " ".join(self.toDict()["pv"]))
+
 """
 Picks a random move
 """
@@ -124,110 +217,660 @@ Helper method to make the first recursive call in Min/Max algorithm
 """
 
 
-def findBestMove(gs, validMoves, returnQueue):
-    global nextMove, counter
-    nextMove = None
-    counter = 0
-    # findMoveMinMax(gs, validMoves, DEPTH,gs.whiteToMove)
-    # findMoveNegaMax(gs, validMoves, DEPTH, 1 if gs.whiteToMove else -1)
-    findMoveNegaMaxAlphaBeta(gs, validMoves, DEPTH, -CHECKMATE, CHECKMATE, 1 if gs.whiteToMove else -1)
-    print(counter)
-    returnQueue.put(nextMove)
+def findBestMove(gs, validMoves, returnQueue, table=None, time_ms=None, max_depth=None, workers=None, stop=None,
+                 useBook=True, stream=None):
+    """
+    Searches the position with a new Searcher (see Searcher.search) and puts the Move it picked, or None, on
+    returnQueue. Returns the SearchStats of the search
+    """
+    searcher = Searcher(table, workers, useBook)
+    stats = searcher.search(gs, validMoves, time_ms, max_depth, stop, stream)
+    returnQueue.put(searcher.bestMove)
+    return stats
 
 
-"""
-Recursive Min/Max Algorithm
-"""
+class Searcher:
+    """
+    The alpha-beta search, with its own configuration, transposition table, move ordering tables and statistics.
+    Searchers share nothing but the read-only opening book and endgame tablebases, so any number of them can search
+    different games in one process, in threads, or at different depths side by side. One Searcher runs one search at
+    a time; keep one per game so its transposition table carries over from move to move.
+    """
 
+    def __init__(self, table=None, workers=None, useBook=True, depth=DEPTH, verbose=True, pvs=USE_PVS,
+                 aspiration=USE_ASPIRATION):
+        self.transpositionTable = table
+        self.workers = THREADS if workers is None else workers
+        self.useBook = useBook
+        self.depth = depth  # max_depth of a search that isn't given one
+        self.verbose = verbose  # print the stats of every search
+        self.infinite = False  # keep deepening after the root is proven won or lost, when only a stop ends the search
+        self.pvs = pvs  # principal variation search, see findMoveNegaMaxAlphaBeta
+        self.aspiration = aspiration  # aspiration windows from depth 2 of an iterative search, see aspirationSearch
+        self.bestMove = None  # Move the last search picked
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Clears what the previous search left behind, everything but the transposition table
+        """
+        self.stats = SearchStats()
+        self.nextMove = None
+        self.rootDepth = self.depth  # depth of the running iteration, so the root node knows it has to set nextMove
+        self.deadline = None  # time.perf_counter() value at which a timed search gives up
+        self.aborted = False
+        self.stopFlag = None  # the caller's shared RawValue that aborts the search, Lazy SMP helpers poll it too
+        self.helperStop = None  # RawValue of this search's own that stops its Lazy SMP helpers once it is done
+        self.helperNodes = None  # shared RawArray the helper processes report their node counts in
+        self.killerMoves = [[None, None] for _ in range(MAX_PLY)]  # two quiet moves per ply that caused a cutoff
+        self.historyScores = [0] * 4096  # per (start, end) square pair: how much quiet moves like it caused cutoffs
+        self.bestRootMove = None  # best move of the previous iteration, searched first at the root
+
+    def search(self, gs, validMoves, time_ms=None, max_depth=None, stop=None, stream=None):
+        """
+        Without time_ms this searches max_depth (self.depth by default) straight away. With time_ms it deepens one ply
+        at a time, searching the previous iteration's best move first, and returns the best move of the deepest
+        iteration that finished in time. Depth 1 is always completed so there is a move to return. Every iteration after
+        the first starts in an aspiration window around the previous score (see aspirationSearch).
+
+        With more than one worker it runs a Lazy SMP search: workers - 1 helper processes search the same position at
+        staggered depths and in shuffled order, and all of them share one transposition table, so the main search
+        keeps finding subtrees the helpers have already scored. Only the main search picks the move.
+
+        stop is an optional shared RawValue: setting it to 1 from another process aborts the search (see
+        SearchWorker). While the position is in the opening book (OPENING_BOOK_PATH) a book move is played without
+        searching at all, and so is the best move by the endgame tablebases once there are few enough pieces left.
+
+        The Move picked (or None) ends up in bestMove. Returns the SearchStats of the search. With a stream (any
+        file-like object) their JSON is also written to it as one line per completed iteration.
+        """
+        self.reset()
+        stats = self.stats
+        self.bestMove = None
+        if self.useBook:
+            bookMove = findBookMove(gs, validMoves)
+            if bookMove is not None:
+                if self.verbose:
+                    print("book move")
+                stats.source = "book"
+                self.recordIteration(gs, 0, None, bookMove.code, stream)
+                self.bestMove = bookMove
+                return stats
+        tablebaseMove = findTablebaseMove(gs, validMoves)
+        if tablebaseMove is not None:
+            if self.verbose:
+                print("tablebase move")
+            stats.source = "tablebase"
+            self.recordIteration(gs, 0, None, tablebaseMove.code, stream)
+            self.bestMove = tablebaseMove
+            return stats
+        workers = self.workers
+        if workers > 1 and self.transpositionTable is None:
+            self.transpositionTable = TranspositionTable()  # the helpers only help through the shared table
+        if self.transpositionTable is not None:
+            self.transpositionTable.newSearch()
+        turnMultiplier = 1 if gs.whiteToMove else -1
+        movesByCode = {move.code: move for move in validMoves}
+        rootMoves = list(movesByCode)
+        if max_depth is None:
+            max_depth = self.depth
+        stopTime = None if time_ms is None else time.perf_counter() + time_ms / 1000
+
+        helpers = []
+        self.stopFlag = stop
+        if workers > 1:
+            self.helperStop = RawValue("b", 0)
+            self.helperNodes = RawArray("q", workers - 1)
+            for index in range(workers - 1):
+                helper = Process(target=searchHelper, args=(gs, rootMoves, self.transpositionTable, self.stopFlag,
+                                                            self.helperStop, self.helperNodes, index, max_depth,
+                                                            stopTime, self.pvs), daemon=True)
+                helper.start()
+                helpers.append(helper)
+
+        if time_ms is None and not helpers:
+            self.rootDepth = max_depth
+            # self.findMoveMinMax(gs, validMoves, max_depth, gs.whiteToMove)
+            # self.findMoveNegaMax(gs, validMoves, max_depth, 1 if gs.whiteToMove else -1)
+            score = self.findMoveNegaMaxAlphaBeta(gs, rootMoves, max_depth, -CHECKMATE, CHECKMATE, turnMultiplier)
+            bestMove = self.nextMove
+            if not self.aborted:
+                if bestMove is None and rootMoves:  # every move gets mated, still play one
+                    bestMove = rootMoves[0]
+                self.recordIteration(gs, max_depth, score, bestMove, stream)
+        else:
+            bestMove = None
+            score = None
+            for depth in range(1, max_depth + 1):
+                self.rootDepth = depth
+                if self.aspiration and score is not None:
+                    score = self.aspirationSearch(gs, rootMoves, depth, score, turnMultiplier)
+                else:
+                    self.nextMove = None
+                    score = self.findMoveNegaMaxAlphaBeta(gs, rootMoves, depth, -CHECKMATE, CHECKMATE, turnMultiplier)
+                if self.aborted:
+                    break
+                # every move got mated when nextMove is None: keep the previous iteration's move, which held out
+                # longest, or any move at depth 1
+                if self.nextMove is not None:
+                    bestMove = self.nextMove
+                    self.bestRootMove = bestMove  # search it first in the next iteration
+                elif bestMove is None and rootMoves:
+                    bestMove = rootMoves[0]
+                self.recordIteration(gs, depth, score, bestMove, stream)
+                # a mate or tablebase result at the root won't change with more depth
+                if (abs(score) > TABLEBASE_WIN - 1 and not self.infinite) or \
+                        (stopTime is not None and time.perf_counter() >= stopTime):
+                    break
+                self.deadline = stopTime
+
+        if helpers:
+            self.helperStop.value = 1  # not the caller's flag, which may outlive this search
+            for helper in helpers:
+                helper.join()
+            stats.helperNodes = sum(self.helperNodes)
+        stats.elapsed = time.perf_counter() - stats.startTime
+        if self.verbose:
+            print(stats)
+        self.stopFlag = None
+        self.bestMove = movesByCode.get(bestMove)
+        return stats
+
+    def recordIteration(self, gs, depth, score, bestMove, stream):
+        """
+        Puts the result of a completed iteration in stats and streams it
+        """
+        stats = self.stats
+        stats.depth = depth
+        stats.score = score
+        stats.bestMove = bestMove
+        stats.pv = self.principalVariation(gs, bestMove, max(depth, 1))
+        stats.elapsed = time.perf_counter() - stats.startTime
+        if stream is not None:
+            stream.write(stats.toJson() + "\n")
+            stream.flush()
+
+    def principalVariation(self, gs, firstMove, length):
+        """
+        The line the search expects: firstMove, then the best moves the transposition table has for the positions
+        after it. A move that isn't legal (a collision or an overwritten entry) or a repetition ends the line early
+        """
+        pv = []
+        move = firstMove
+        while move is not None and len(pv) < length:
+            pv.append(move)
+            gs.makeMoveCode(move)
+            if self.transpositionTable is None or gs.isRepetition():
+                break
+            entry = self.transpositionTable.probe(gs.zobristKey)
+            move = entry[3] if entry is not None else None
+            if move is not None and move not in gs.getLegalMoves():
+                move = None
+        for _ in pv:
+            gs.undoMove()
+        return pv
 
-def findMoveMinMax(gs, validMoves, depth, whiteToMove):
-    global nextMove, counter
-    counter += 1
+    """
+    Recursive Min/Max Algorithm
+    """
 
-    if depth == 0:
-        return scoreMaterial(gs.board)
+    def findMoveMinMax(self, gs, validMoves, depth, whiteToMove):
+        self.stats.nodes += 1
+
+        if depth == 0:
+            return scoreMaterial(gs.board)
+
+        random.shuffle(validMoves)
+        if whiteToMove:
+            maxScore = -CHECKMATE  # start at lowest score possible in order to find improvements
+            for move in validMoves:
+                gs.makeMove(move)
+                nextMoves = gs.getValidMoves()
+                score = self.findMoveMinMax(gs, nextMoves, depth - 1, False)
+                if score > maxScore:
+                    maxScore = score
+                    if depth == self.rootDepth:
+                        self.nextMove = move
+                gs.undoMove()
+            return maxScore
+        else:
+            minScore = CHECKMATE  # start at highest score possible in order to find downgrades
+            for move in validMoves:
+                gs.makeMove(move)
+                nextMoves = gs.getValidMoves()
+                score = self.findMoveMinMax(gs, nextMoves, depth - 1, True)
+                if score < minScore:
+                    minScore = score
+                    if depth == self.rootDepth:
+                        self.nextMove = move
+                gs.undoMove()
+            return minScore
 
-    random.shuffle(validMoves)
-    if whiteToMove:
+    """
+    Nega Max Algorithm (improved version of min/max algorithm)
+    """
+
+    def findMoveNegaMax(self, gs, validMoves, depth, turnMultiplier):
+        self.stats.nodes += 1
+
+        if depth == 0:
+            return turnMultiplier * scoreBoard(gs)
         maxScore = -CHECKMATE  # start at lowest score possible in order to find improvements
+        random.shuffle(validMoves)
         for move in validMoves:
             gs.makeMove(move)
             nextMoves = gs.getValidMoves()
-            score = findMoveMinMax(gs, nextMoves, depth - 1, False)
+            score = -self.findMoveNegaMax(gs, nextMoves, depth - 1, -turnMultiplier)
             if score > maxScore:
                 maxScore = score
-                if depth == DEPTH:
-                    nextMove = move
+                if depth == self.rootDepth:
+                    self.nextMove = move
             gs.undoMove()
         return maxScore
-    else:
-        minScore = CHECKMATE  # start at highest score possible in order to find downgrades
-        for move in validMoves:
-            gs.makeMove(move)
-            nextMoves = gs.getValidMoves()
-            score = findMoveMinMax(gs, nextMoves, depth - 1, True)
-            if score < minScore:
-                minScore = score
-                if depth == DEPTH:
-                    nextMove = move
+
+    def isStopped(self) -> bool:
+        """
+        True once the deadline has passed or a stop flag is set, and from then on for the rest of the search
+        """
+        if (self.deadline is not None and time.perf_counter() >= self.deadline) or \
+                (self.stopFlag is not None and self.stopFlag.value) or \
+                (self.helperStop is not None and self.helperStop.value):
+            self.aborted = True  # every caller up the tree drops what it was doing
+        return self.aborted
+
+    def findMoveNegaMaxAlphaBeta(self, gs, validMoves, depth, alpha, beta, turnMultiplier):
+        """
+        basically stops looking further down the recursion tree if a move you MADE is already terrible
+        """
+        stats = self.stats
+        stats.nodes += 1
+        if self.isStopped():
+            return 0
+        rootDepth = self.rootDepth
+        if depth != rootDepth and (gs.isRepetition() or (gs.halfmoveClock >= 100 and validMoves)):
+            return STALEMATE  # a repeated position or the fifty-move rule, both draws
+        if endgameTablebase is not None and depth != rootDepth and pieceCount(gs) <= endgameTablebase.maxPieces:
+            result = endgameTablebase.probe(gs)
+            if result is not None:
+                return tablebaseScore(result, rootDepth - depth)
+        ply = rootDepth - depth
+        if depth == 0:
+            return self.quiescenceSearch(gs, alpha, beta, turnMultiplier, ply)
+        if ply > stats.seldepth:
+            stats.seldepth = ply
+
+        alphaOrig = alpha
+        ttMove = None
+        entry = None
+        table = self.transpositionTable
+        if table is not None:
+            stats.ttProbes += 1
+            entry = table.probe(gs.zobristKey)
+        if entry is not None:
+            stats.ttHits += 1
+            ttDepth, ttScore, ttBound, ttMove = entry
+            if ttDepth >= depth and depth != rootDepth:  # the root still has to pick nextMove
+                if ttBound == EXACT:
+                    return ttScore
+                elif ttBound == LOWER_BOUND:
+                    alpha = max(alpha, ttScore)
+                else:
+                    beta = min(beta, ttScore)
+                if alpha >= beta:
+                    return ttScore
+        if ply == 0 and self.bestRootMove is not None:
+            ttMove = self.bestRootMove
+        self.orderMoves(gs, validMoves, ttMove, ply)
+
+        maxScore = -CHECKMATE  # start at lowest score possible in order to find improvements
+        bestMove = None
+        for i, move in enumerate(validMoves):
+            gs.makeMoveCode(move)
+            nextMoves = gs.getLegalMoves()
+            if i == 0 or not self.pvs or alpha + NULL_WINDOW >= beta:
+                score = -self.findMoveNegaMaxAlphaBeta(gs, nextMoves, depth - 1, -beta, -alpha, -turnMultiplier)
+            else:
+                # principal variation search: with good ordering the first move is the best, so the others only have
+                # to be proven no better with a null window, and one that does beat it is searched again properly
+                score = -self.findMoveNegaMaxAlphaBeta(gs, nextMoves, depth - 1, -alpha - NULL_WINDOW, -alpha,
+                                                       -turnMultiplier)
+                if alpha < score < beta and not self.aborted:
+                    stats.pvsResearches += 1
+                    score = -self.findMoveNegaMaxAlphaBeta(gs, nextMoves, depth - 1, -beta, -alpha, -turnMultiplier)
             gs.undoMove()
-        return minScore
+            if self.aborted:
+                return 0
+            if score > maxScore:
+                maxScore = score
+                bestMove = move
+                if depth == rootDepth:
+                    self.nextMove = move
+            if maxScore > alpha:  # pruning happens
+                alpha = maxScore
+            if alpha >= beta:
+                stats.betaCutoffs += 1
+                if i == 0:
+                    stats.firstMoveCutoffs += 1
+                if isQuietMove(gs, move):  # remember quiet moves that refute a position for the sibling nodes
+                    killers = self.killerMoves
+                    if ply < MAX_PLY and killers[ply][0] != move:
+                        killers[ply][1] = killers[ply][0]
+                        killers[ply][0] = move
+                    self.historyScores[move & 0xFFF] += depth * depth
+                break
+
+        if table is not None:
+            if maxScore <= alphaOrig:
+                bound = UPPER_BOUND  # nothing beat alpha, the real score may be even lower
+            elif maxScore >= beta:
+                bound = LOWER_BOUND  # cut off, the real score may be even higher
+            else:
+                bound = EXACT
+            table.store(gs.zobristKey, depth, maxScore, bound, bestMove)
+        return maxScore
 
+    def aspirationSearch(self, gs, rootMoves, depth, guess, turnMultiplier):
+        """
+        Searches the root in a window of ASPIRATION_WINDOW either side of guess, the previous iteration's score, which
+        cuts off more than the full window as long as the score doesn't move much. When the score falls outside it,
+        that side of the window is widened fourfold and the root searched again, until it reaches the full window
+        """
+        window = ASPIRATION_WINDOW
+        alpha, beta = max(guess - window, -CHECKMATE), min(guess + window, CHECKMATE)
+        while True:
+            self.nextMove = None  # a move that failed low is no better than a guess
+            score = self.findMoveNegaMaxAlphaBeta(gs, rootMoves, depth, alpha, beta, turnMultiplier)
+            if self.aborted:
+                return score
+            if score <= alpha and alpha > -CHECKMATE:
+                window *= 4
+                alpha = max(guess - window, -CHECKMATE)
+            elif score >= beta and beta < CHECKMATE:
+                window *= 4
+                beta = min(guess + window, CHECKMATE)
+            else:
+                return score
+            self.stats.aspirationResearches += 1
+
+    def quiescenceSearch(self, gs, alpha, beta, turnMultiplier, ply):
+        """
+        Keeps searching captures and promotions past depth 0 until the position is quiet, so the search never stops
+        halfway through an exchange. The side to move can always "stand pat" on the static score instead of
+        capturing, except when in check, where every evasion is searched
+        """
+        stats = self.stats
+        stats.nodes += 1
+        stats.qnodes += 1
+        if ply > stats.seldepth:
+            stats.seldepth = ply
+        if self.isStopped():
+            return 0
+        standPat = turnMultiplier * scoreBoard(gs)
+        if gs.checkmate or gs.stalemate:
+            return standPat
+
+        inCheck = gs.inCheck()
+        if inCheck:
+            moves = gs.getLegalMoves()
+            if gs.checkmate:
+                return -CHECKMATE
+            maxScore = -CHECKMATE
+        else:
+            if standPat >= beta:
+                return standPat
+            # delta pruning: not even winning a queen would get back to alpha. A capture that promotes can win more,
+            # so not while a pawn is about to
+            pawn, rank = PROMOTION_RANK_PAWNS[gs.whiteToMove]
+            if standPat + ChessEngine.valueOfPiece["Q"] + DELTA_MARGIN < alpha and not gs.bitboards[pawn] & rank:
+                return standPat
+            if standPat > alpha:
+                alpha = standPat
+            moves = gs.getCaptureMoves()
+            maxScore = standPat
+        self.orderMoves(gs, moves, None, MAX_PLY)
+
+        for move in moves:
+            # delta pruning: this capture can't raise the score to alpha even with a positional bonus on top. Only
+            # outside check, where standing pat is an option and the static score a bound; an evasion is never pruned
+            if not inCheck and move >> 12 < ChessEngine.FIRST_PROMOTION:
+                captured = gs.board[(move >> 9) & 7][(move >> 6) & 7]
+                if captured != "--" and standPat + ChessEngine.valueOfPiece[captured[1]] + DELTA_MARGIN <= alpha:
+                    continue
+            gs.makeMoveCode(move)
+            score = -self.quiescenceSearch(gs, -beta, -alpha, -turnMultiplier, ply + 1)
+            gs.undoMove()
+            if self.aborted:
+                return 0
+            if score > maxScore:
+                maxScore = score
+            if maxScore > alpha:
+                alpha = maxScore
+            if alpha >= beta:
+                break
+        return maxScore
 
-"""
-Nega Max Algorithm (improved version of min/max algorithm)
-"""
+    """
+    Sorts the moves best-first for alpha-beta: the transposition table move, then captures by MVV-LVA and
+    promotions, then the killer moves of this ply, then the other quiet moves by their history score
+    """
 
+    def orderMoves(self, gs, validMoves, ttMove, ply):
+        killers = self.killerMoves[ply] if ply < MAX_PLY else (None, None)
+        historyScores = self.historyScores
+        board = gs.board
+
+        def moveOrderScore(move):
+            if move == ttMove:
+                return 3000000
+            captured = board[(move >> 9) & 7][(move >> 6) & 7]
+            if captured != "--":
+                return 2000000 + 10 * ORDER_VALUE[captured[1]] - ORDER_VALUE[board[(move >> 3) & 7][move & 7][1]]
+            flag = move >> 12
+            if flag == ChessEngine.EN_PASSANT:
+                return 2000000 + 10 * ORDER_VALUE["P"] - ORDER_VALUE["P"]
+            if flag >= ChessEngine.FIRST_PROMOTION:
+                return 2000000 + flag
+            if move == killers[0]:
+                return 1000001
+            if move == killers[1]:
+                return 1000000
+            return historyScores[move & 0xFFF]
+
+        validMoves.sort(key=moveOrderScore, reverse=True)
+
+
+class SearchWorker:
+    """
+    Long-lived search process for the GUI. Starting a Process per move pickles the whole GameState and pays for
+    process startup every turn. This worker instead keeps its own GameState and Searcher between moves.
+    Each search request only sends the moves that changed since the last one: how many of the previously sent moves
+    still stand, and the move codes played after them.
 
-def findMoveNegaMax(gs, validMoves, depth, turnMultiplier):
-    global nextMove, counter
-    counter += 1
+    search() starts a search and poll() reports when its move is in bestMove. cancel() makes the worker drop the
+    current search at its next node, through a shared flag, so the process never has to be terminated.
+    """
 
-    if depth == 0:
-        return turnMultiplier * scoreBoard(gs)
-    maxScore = -CHECKMATE  # start at lowest score possible in order to find improvements
-    random.shuffle(validMoves)
-    for move in validMoves:
-        gs.makeMove(move)
-        nextMoves = gs.getValidMoves()
-        score = -findMoveNegaMax(gs, nextMoves, depth - 1, -turnMultiplier)
-        if score > maxScore:
-            maxScore = score
-            if depth == DEPTH:
-                nextMove = move
-        gs.undoMove()
-    return maxScore
+    def __init__(self, workers=None, tableSizeMB=TT_SIZE_MB):
+        self.commands = Queue()
+        self.results = Queue()
+        self.stop = RawValue("b", 0)
+        self.cancelledId = RawValue("i", 0)  # searches with this id or lower are not wanted any more
+        self.searchId = 0
+        self.sentMoves = []  # move codes the worker's GameState has played, as far as this side knows
+        self.movesByCode = {}
+        self.bestMove = None
+        self.stats = None  # SearchStats.toDict() of the latest search
+        self.process = Process(target=searchWorkerLoop, args=(self.commands, self.results, self.stop,
+                                                              self.cancelledId, workers, tableSizeMB), daemon=True)
+        self.process.start()
+
+    def search(self, gs, validMoves, time_ms=None, max_depth=None) -> None:
+        moves = [record[0] for record in gs.history]
+        keep = 0
+        for sent, move in zip(self.sentMoves, moves):
+            if sent != move:
+                break
+            keep += 1
+        self.searchId += 1
+        self.commands.put(("search", self.searchId, keep, moves[keep:], time_ms, max_depth))
+        self.sentMoves = moves
+        self.movesByCode = {move.code: move for move in validMoves}
+        self.bestMove = None
+        self.stats = None
+
+    def poll(self) -> bool:
+        """
+        True once the latest search has finished, with its move (or None) in bestMove and its stats in stats.
+        Results of cancelled searches are skipped
+        """
+        while True:
+            try:
+                searchId, code, stats = self.results.get_nowait()
+            except queue.Empty:
+                return False
+            if searchId == self.searchId:
+                self.bestMove = self.movesByCode.get(code)
+                self.stats = stats
+                return True
+
+    def cancel(self) -> None:
+        self.cancelledId.value = self.searchId  # before the flag, see searchWorkerLoop
+        self.stop.value = 1
+
+    def close(self) -> None:
+        self.cancel()
+        self.commands.put(("quit",))
+        self.process.join()
+
+
+def searchWorkerLoop(commands, results, stop, cancelledId, workers, tableSizeMB):
+    gs = ChessEngine.GameState()
+    played = []
+    searcher = Searcher(TranspositionTable(tableSizeMB), workers)
+    while True:
+        command = commands.get()
+        if command[0] == "quit":
+            return
+        _, searchId, keep, newMoves, time_ms, max_depth = command
+        while len(played) > keep:
+            gs.undoMove()
+            played.pop()
+        for move in newMoves:
+            gs.makeMoveCode(move)
+            played.append(move)
+        # clear the flag before checking the id: cancel() writes them the other way round, so a cancel that
+        # lands in between still stops the search
+        stop.value = 0
+        if cancelledId.value >= searchId:
+            results.put((searchId, None, None))
+            continue
+        stats = searcher.search(gs, gs.getValidMoves(), time_ms, max_depth, stop)
+        move = searcher.bestMove
+        results.put((searchId, None if move is None else move.code, stats.toDict()))
+
+
+def loadOpeningBook(path=OPENING_BOOK_PATH):
+    """
+    Opens the book findBestMove plays from. Memory-mapped, so this costs next to nothing even for a large book
+    """
+    global openingBook, openingBookLoaded
+    if openingBook is not None:
+        openingBook.close()
+    openingBook = OpeningBook.OpeningBook(path) if os.path.exists(path) else None
+    openingBookLoaded = True
 
 
-def findMoveNegaMaxAlphaBeta(gs, validMoves, depth, alpha, beta, turnMultiplier):
+def findBookMove(gs, validMoves):
     """
-    basically stops looking further down the recursion tree if a move you MADE is already terrible
+    A weighted random book move for the position, or None when it is out of book (or there is no book)
     """
-    global nextMove, counter
-    counter += 1
-    if depth == 0:
-        return turnMultiplier * scoreBoard(gs)
+    if not openingBookLoaded:
+        loadOpeningBook()
+    if openingBook is None:
+        return None
+    movesByCode = {move.code: move for move in validMoves}
+    code = openingBook.pickMove(gs.zobristKey, movesByCode)
+    return movesByCode.get(code)
+
 
-    # move ordering - add later
-    maxScore = -CHECKMATE  # start at lowest score possible in order to find improvements
+def loadTablebases(directory=None):
+    """
+    Opens the endgame tablebases findBestMove and the search probe, the directory Tablebase.py writes by default
+    """
+    global endgameTablebase, endgameTablebaseLoaded
+    if endgameTablebase is not None:
+        endgameTablebase.close()
+    endgameTablebase = Tablebase.Tablebase(directory or Tablebase.TABLEBASE_DIR)
+    endgameTablebaseLoaded = True
+
+
+def pieceCount(gs):
+    return bin(gs.occupancy["w"] | gs.occupancy["b"]).count("1")
+
+
+def tablebaseScore(result, ply):
+    """
+    Search score of a tablebase result (outcome, plies to mate) for a position ply plies below the root, so that of
+    two won lines the one that mates first scores higher
+    """
+    outcome, plies = result
+    return outcome * (TABLEBASE_WIN - (ply + plies) / 1000)
+
+
+def findTablebaseMove(gs, validMoves):
+    """
+    The move with the best tablebase result when the position is in the tablebases: the fastest mate when winning,
+    the longest resistance when losing. None when it isn't, or when some move leads out of the tables
+    """
+    if not endgameTablebaseLoaded:
+        loadTablebases()
+    if pieceCount(gs) > endgameTablebase.maxPieces or endgameTablebase.probe(gs) is None:
+        return None
+    bestMove, bestScore = None, None
     for move in validMoves:
         gs.makeMove(move)
-        nextMoves = gs.getValidMoves()
-        score = -findMoveNegaMaxAlphaBeta(gs, nextMoves, depth - 1, -beta, -alpha, -turnMultiplier)
-        if score > maxScore:
-            maxScore = score
-            if depth == DEPTH:
-                nextMove = move
+        result = endgameTablebase.probe(gs)
         gs.undoMove()
-        if maxScore > alpha:  # pruning happens
-            alpha = maxScore
-        if alpha >= beta:
+        if result is None:
+            return None
+        score = -tablebaseScore(result, 1)
+        if bestScore is None or score > bestScore:
+            bestMove, bestScore = move, score
+    return bestMove
+
+
+def searchHelper(gs, rootMoves, table, stop, helperStop, nodes, index, max_depth, stopTime, pvs=USE_PVS):
+    """
+    Runs in a helper process of a Lazy SMP search. Deepens like the main search until the main search sets helperStop
+    or the caller sets stop, but every other helper starts one ply deeper and each one shuffles its root moves, so the
+    helpers spread out over different parts of the tree instead of all repeating the main search's work. Results only
+    go to the table.
+    """
+    if not endgameTablebaseLoaded:
+        loadTablebases()
+    searcher = Searcher(table, workers=1, pvs=pvs)
+    searcher.stopFlag = stop
+    searcher.helperStop = helperStop
+    searcher.deadline = stopTime
+    rng = random.Random(index)
+    turnMultiplier = 1 if gs.whiteToMove else -1
+    for depth in range(1 + index % 2, max_depth + 1):
+        searcher.rootDepth = depth
+        rng.shuffle(rootMoves)
+        searcher.findMoveNegaMaxAlphaBeta(gs, rootMoves, depth, -CHECKMATE, CHECKMATE, turnMultiplier)
+        if searcher.aborted:
             break
-    return maxScore
+    nodes[index] = searcher.stats.nodes
+
+
+def isQuietMove(gs, move):
+    return gs.board[(move >> 9) & 7][(move >> 6) & 7] == "--" and \
+        move >> 12 != ChessEngine.EN_PASSANT and move >> 12 < ChessEngine.FIRST_PROMOTION
 
 
 """
 More comprehensive evaluation of the board ("+" score is good for white)
+Material and position are kept up to date by GameState.makeMove/undoMove (in tenths of a pawn), so this is O(1)
 """
 
 
@@ -239,7 +882,15 @@ def scoreBoard(gs):
             return CHECKMATE  # White wins
     elif gs.stalemate:
         return STALEMATE
+    return gs.boardScore / 10
+
+
+"""
+scoreBoard the slow way, adding up every square. Kept to check the incremental score against
+"""
 
+
+def scoreBoardFull(gs):
     score = 0
     for row in range(len(gs.board)):
         for col in range(len(gs.board)):
@@ -248,14 +899,14 @@ def scoreBoard(gs):
             if square != "--":
                 # score it positionally
                 if piece == "P":  # for pawns
-                    piecePositionScore = piecePositionScores[square][row][col]
+                    piecePositionScore = ChessEngine.piecePositionScores[square][row][col]
                 else:  # for other pieces
-                    piecePositionScore = piecePositionScores[piece][row][col]
+                    piecePositionScore = ChessEngine.piecePositionScores[piece][row][col]
 
                 if square[0] == 'w':
-                    score += valueOfPiece[piece] + piecePositionScore * 0.10
+                    score += ChessEngine.valueOfPiece[piece] + piecePositionScore * 0.10
                 elif square[0] == 'b':
-                    score -= valueOfPiece[piece] + piecePositionScore * 0.10
+                    score -= ChessEngine.valueOfPiece[piece] + piecePositionScore * 0.10
     return score
 
 
@@ -270,7 +921,65 @@ def scoreMaterial(board):
         for square in row:
             piece = square[1]
             if square[0] == 'w':
-                score += valueOfPiece[piece]
+                score += ChessEngine.valueOfPiece[piece]
             elif square[0] == 'b':
-                score -= valueOfPiece[piece]
+                score -= ChessEngine.valueOfPiece[piece]
     return score
+
+
+# Batch scoring. Positions come as (N, 64) int8 arrays, one signed piece code per square (0 empty, 1-6 a white
+# pawn, knight, bishop, rook, queen, king, negative for black), or as (N, 12, 8, 8) arrays of 0/1 planes in
+# BATCH_PIECES order. Squares go a8, b8, ... h1, the same order as GameState.board and the engine's bitboards
+BATCH_PIECES = ("wP", "wN", "wB", "wR", "wQ", "wK", "bP", "bN", "bB", "bR", "bQ", "bK")
+batchScoreTables = None  # (planeScores, squareScores), built on first use
+
+
+"""
+Score in tenths of a pawn of every piece on every square, from the same tables scoreBoardFull reads
+"""
+
+
+def buildBatchScoreTables():
+    global batchScoreTables
+    planeScores = np.zeros((12, 8, 8), dtype=np.int32)
+    for plane, piece in enumerate(BATCH_PIECES):
+        positionScores = ChessEngine.piecePositionScores[piece if piece[1] == "P" else piece[1]]
+        sign = 1 if piece[0] == "w" else -1
+        planeScores[plane] = sign * (10 * ChessEngine.valueOfPiece[piece[1]] + np.array(positionScores, dtype=np.int32))
+    squareScores = np.zeros((13, 64), dtype=np.int32)  # row code + 6, so black king (-6) is row 0 and empty is 6
+    for plane in range(12):
+        code = plane + 1 if plane < 6 else 5 - plane
+        squareScores[code + 6] = planeScores[plane].reshape(64)
+    batchScoreTables = planeScores, squareScores
+    return batchScoreTables
+
+
+def scoreBatch(positions):
+    """
+    scoreBoardFull for a whole batch of positions in one vectorized pass: material plus piece-square score in pawns,
+    positive when white is ahead, as a float64 array of length N. Like scoreBoardFull it doesn't know about
+    checkmate or stalemate. Needs numpy
+    """
+    if np is None:
+        raise ImportError("scoreBatch needs numpy, install it with: pip install numpy")
+    planeScores, squareScores = batchScoreTables or buildBatchScoreTables()
+    positions = np.asarray(positions)
+    if positions.ndim == 4 and positions.shape[1:] == (12, 8, 8):
+        tenths = np.einsum("nprc,prc->n", positions.astype(np.int32), planeScores)
+    elif positions.ndim == 2 and positions.shape[1] == 64:
+        tenths = squareScores[positions.astype(np.intp) + 6, np.arange(64)].sum(axis=1)
+    else:
+        raise ValueError(f"expected an (N, 64) or (N, 12, 8, 8) array, got shape {positions.shape}")
+    return tenths / 10
+
+
+def encodeBoards(boards):
+    """
+    Packs GameState.board lists into the (N, 64) int8 array scoreBatch takes
+    """
+    if np is None:
+        raise ImportError("encodeBoards needs numpy, install it with: pip install numpy")
+    codes = {"--": 0}
+    for plane, piece in enumerate(BATCH_PIECES):
+        codes[piece] = plane + 1 if plane < 6 else 5 - plane
+    return np.array([[codes[square] for row in board for square in row] for board in boards], dtype=np.int8)
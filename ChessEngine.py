@@ -1,32 +1,301 @@
 # Stores all the information about the state of a chess game. Also determines valid moves + move log
+# The position is stored as 64-bit integer bitboards (bit index = row * 8 + col, so a8 is bit 0 and h1 is bit 63).
+# The 8x8 "board" list is kept in sync with the bitboards so the UI and the AI can keep reading squares directly.
 
-import copy
+import random
 
+# Material in pawns and positional bonuses per square, what ChessAI.scoreBoard and PIECE_SQUARE_SCORES below count
+valueOfPiece = {"K": 0, "Q": 9, "R": 5, "B": 3, "N": 3, "P": 1}
 
-class CastleRights:
-    def __init__(self, wks, bks, wqs, bqs):
-        self.wks = wks
-        self.bks = bks
-        self.wqs = wqs
-        self.bqs = bqs
+knightScores = [[1, 1, 1, 1, 1, 1, 1, 1],
+                [1, 2, 2, 2, 2, 2, 2, 1],
+                [1, 2, 3, 3, 3, 3, 2, 1],
+                [1, 2, 3, 4, 4, 3, 2, 1],
+                [1, 2, 3, 4, 4, 3, 2, 1],
+                [1, 2, 3, 3, 3, 3, 2, 1],
+                [1, 2, 2, 2, 2, 2, 2, 1],
+                [1, 1, 1, 1, 1, 1, 1, 1]]
+
+bishopScores = [[4, 3, 2, 1, 1, 2, 3, 4],
+                [3, 4, 3, 2, 2, 3, 4, 3],
+                [2, 3, 4, 2, 2, 4, 3, 2],
+                [1, 3, 3, 4, 4, 3, 3, 1],
+                [1, 3, 3, 4, 4, 3, 3, 1],
+                [2, 3, 4, 2, 2, 4, 3, 2],
+                [3, 4, 3, 2, 2, 3, 4, 3],
+                [4, 3, 2, 1, 1, 2, 3, 4]]
+
+queenScores = [[1, 1, 1, 3, 1, 1, 1, 1],
+               [1, 2, 2, 2, 2, 2, 2, 1],
+               [1, 4, 3, 3, 3, 3, 4, 1],
+               [1, 3, 2, 3, 3, 2, 3, 1],
+               [1, 3, 2, 3, 3, 2, 3, 1],
+               [1, 4, 3, 3, 3, 3, 4, 1],
+               [1, 2, 2, 2, 2, 2, 2, 1],
+               [1, 1, 1, 3, 1, 1, 1, 1]]
+
+rookScores = [[4, 2, 3, 4, 3, 4, 2, 4],
+              [4, 4, 4, 4, 4, 4, 4, 4],
+              [1, 1, 2, 3, 3, 2, 1, 1],
+              [1, 2, 3, 4, 4, 3, 2, 1],
+              [1, 2, 3, 4, 4, 3, 2, 1],
+              [1, 1, 2, 3, 3, 2, 1, 1],
+              [4, 4, 4, 4, 4, 4, 4, 4],
+              [4, 3, 4, 4, 4, 4, 3, 4]]
+
+whitePawnScores = [[9, 9, 9, 9, 9, 9, 9, 9],
+                   [8, 8, 8, 8, 8, 8, 8, 8],
+                   [5, 6, 7, 7, 7, 7, 6, 5],
+                   [2, 3, 3, 5, 5, 3, 3, 2],
+                   [1, 2, 3, 4, 4, 3, 2, 1],
+                   [1, 1, 2, 3, 3, 2, 1, 1],
+                   [1, 1, 1, 0, 0, 1, 1, 1],
+                   [0, 0, 0, 0, 0, 0, 0, 0]]
+
+blackPawnScores = [[0, 0, 0, 0, 0, 0, 0, 0],
+                   [1, 1, 1, 0, 0, 1, 1, 1],
+                   [1, 1, 2, 3, 3, 2, 1, 1],
+                   [1, 2, 3, 4, 4, 3, 2, 1],
+                   [2, 3, 3, 5, 5, 3, 3, 2],
+                   [5, 6, 7, 7, 7, 7, 6, 5],
+                   [8, 8, 8, 8, 8, 8, 8, 8],
+                   [9, 9, 9, 9, 9, 9, 9, 9]]
+
+kingScores = [[2, 2, 5, 1, 1, 2, 5, 2],
+             [1, 1, 1, 1, 1, 1, 1, 1],
+             [1, 1, 1, 1, 1, 1, 1, 1],
+             [1, 1, 1, 1, 1, 1, 1, 1],
+             [1, 1, 1, 1, 1, 1, 1, 1],
+             [1, 1, 1, 1, 1, 1, 1, 1],
+             [1, 1, 1, 1, 1, 1, 1, 1],
+             [2, 2, 5, 1, 1, 2, 5, 2]]
+
+piecePositionScores = {"N": knightScores, "R": rookScores, "Q": queenScores, "K": kingScores, "B":bishopScores, "bP":blackPawnScores, "wP":whitePawnScores}
+
+PIECES = ("wP", "wN", "wB", "wR", "wQ", "wK", "bP", "bN", "bB", "bR", "bQ", "bK")
+PROMOTION_PIECES = ("Q", "R", "B", "N")
+
+
+def squareBit(r, c) -> int:
+    return 1 << (r * 8 + c)
+
+
+def _buildLeaperAttacks(offsets):
+    table = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        attacks = 0
+        for dr, dc in offsets:
+            if 0 <= r + dr <= 7 and 0 <= c + dc <= 7:
+                attacks |= squareBit(r + dr, c + dc)
+        table.append(attacks)
+    return table
+
+
+KNIGHT_ATTACKS = _buildLeaperAttacks([(-2, -1), (-2, 1), (-1, -2), (-1, 2), (2, -1), (2, 1), (1, -2), (1, 2)])
+KING_ATTACKS = _buildLeaperAttacks([(-1, -1), (-1, 0), (-1, 1), (1, -1), (1, 0), (1, 1), (0, -1), (0, 1)])
+# squares attacked BY a pawn of the given colour standing on a square
+PAWN_ATTACKS = {"w": _buildLeaperAttacks([(-1, -1), (-1, 1)]), "b": _buildLeaperAttacks([(1, -1), (1, 1)])}
+
+
+def _buildLineTables(direction):
+    """
+    For every square and one line through it (rank, file, diagonal or anti-diagonal), map every occupancy of the
+    line's inner squares to the squares a slider on that line attacks. Edge squares never block anything further
+    so they are left out of the mask, which keeps every table at most 64 entries per square.
+    """
+    dr, dc = direction
+    masks, tables = [], []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        rays = []
+        for sign in (1, -1):
+            ray = []
+            nr, nc = r + dr * sign, c + dc * sign
+            while 0 <= nr <= 7 and 0 <= nc <= 7:
+                ray.append(nr * 8 + nc)
+                nr, nc = nr + dr * sign, nc + dc * sign
+            rays.append(ray)
+        mask = 0
+        for ray in rays:
+            for s in ray[:-1]:
+                mask |= 1 << s
+        table = {}
+        occ = 0
+        while True:  # walks every subset of mask
+            attacks = 0
+            for ray in rays:
+                for s in ray:
+                    attacks |= 1 << s
+                    if occ & (1 << s):
+                        break
+            table[occ] = attacks
+            occ = (occ - mask) & mask
+            if occ == 0:
+                break
+        masks.append(mask)
+        tables.append(table)
+    return masks, tables
+
+
+RANK_MASKS, RANK_ATTACKS = _buildLineTables((0, 1))
+FILE_MASKS, FILE_ATTACKS = _buildLineTables((1, 0))
+DIAG_MASKS, DIAG_ATTACKS = _buildLineTables((1, 1))
+ANTI_DIAG_MASKS, ANTI_DIAG_ATTACKS = _buildLineTables((1, -1))
+
+
+ALL_SQUARES = (1 << 64) - 1
+PROMOTION_RANKS = 0xFF | 0xFF << 56  # rows 0 and 7
+NOT_A_FILE = ALL_SQUARES ^ 0x0101010101010101
+NOT_H_FILE = ALL_SQUARES ^ 0x8080808080808080
+
+# Zobrist keys. Fixed seed so the same position hashes the same in every process (search workers, saved tables)
+_zobristRandom = random.Random(20240101)
+ZOBRIST_PIECES = {piece: [_zobristRandom.getrandbits(64) for _ in range(64)] for piece in PIECES}
+ZOBRIST_BLACK_TO_MOVE = _zobristRandom.getrandbits(64)
+ZOBRIST_CASTLING = {right: _zobristRandom.getrandbits(64) for right in ("wks", "bks", "wqs", "bqs")}
+ZOBRIST_ENPASSANT = [_zobristRandom.getrandbits(64) for _ in range(8)]  # one per file
+
+
+# What ChessAI.scoreBoard counts for a piece on each square (material + positional), in tenths of a pawn and from
+# white's point of view. Kept as ints so the running total in makeMove/undoMove never drifts
+PIECE_SQUARE_SCORES = {}
+for _piece in PIECES:
+    _positionScores = piecePositionScores[_piece] if _piece[1] == "P" else piecePositionScores[_piece[1]]
+    _sign = 1 if _piece[0] == "w" else -1
+    PIECE_SQUARE_SCORES[_piece] = [_sign * (10 * valueOfPiece[_piece[1]] + _positionScores[sq // 8][sq % 8])
+                                   for sq in range(64)]
+
+
+# Castling rights are a 4-bit int, one bit per right
+WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE = 1, 2, 4, 8
+ALL_CASTLING = 15
+CASTLING_LETTERS = (("K", WHITE_KINGSIDE), ("Q", WHITE_QUEENSIDE), ("k", BLACK_KINGSIDE), ("q", BLACK_QUEENSIDE))
+# Rights that survive a move from or to each square: anything leaving or landing on a king's or rook's home square
+# (the king or rook moving, or the rook being captured) drops the rights that need it
+CASTLING_MASKS = [ALL_CASTLING] * 64
+CASTLING_MASKS[60] ^= WHITE_KINGSIDE | WHITE_QUEENSIDE  # e1
+CASTLING_MASKS[63] ^= WHITE_KINGSIDE  # h1
+CASTLING_MASKS[56] ^= WHITE_QUEENSIDE  # a1
+CASTLING_MASKS[4] ^= BLACK_KINGSIDE | BLACK_QUEENSIDE  # e8
+CASTLING_MASKS[7] ^= BLACK_KINGSIDE  # h8
+CASTLING_MASKS[0] ^= BLACK_QUEENSIDE  # a8
+# Home squares of the king and rook each right needs, (king square, rook square, colour)
+CASTLING_HOMES = {WHITE_KINGSIDE: (60, 63, "w"), WHITE_QUEENSIDE: (60, 56, "w"), BLACK_KINGSIDE: (4, 7, "b"),
+                  BLACK_QUEENSIDE: (4, 0, "b")}
+# Zobrist key of every combination of rights, the same values the four separate keys xor to
+CASTLING_KEYS = [0] * 16
+for _rights in range(16):
+    for _name, _bit in (("wks", WHITE_KINGSIDE), ("wqs", WHITE_QUEENSIDE), ("bks", BLACK_KINGSIDE),
+                        ("bqs", BLACK_QUEENSIDE)):
+        if _rights & _bit:
+            CASTLING_KEYS[_rights] ^= ZOBRIST_CASTLING[_name]
+
+
+def _buildBetweenTable():
+    """
+    BETWEEN[a][b] holds the squares strictly between a and b when they share a rank, file or diagonal, else 0
+    """
+    table = [[0] * 64 for _ in range(64)]
+    for a in range(64):
+        for b in range(64):
+            if a != b:
+                for masks, attacks in ((RANK_MASKS, RANK_ATTACKS), (FILE_MASKS, FILE_ATTACKS),
+                                       (DIAG_MASKS, DIAG_ATTACKS), (ANTI_DIAG_MASKS, ANTI_DIAG_ATTACKS)):
+                    fromA = attacks[a][(1 << b) & masks[a]]
+                    if fromA & (1 << b):
+                        table[a][b] = fromA & attacks[b][(1 << a) & masks[b]]
+    return table
+
+
+BETWEEN = _buildBetweenTable()
+
+
+def rookAttacks(sq, occupied) -> int:
+    return RANK_ATTACKS[sq][occupied & RANK_MASKS[sq]] | FILE_ATTACKS[sq][occupied & FILE_MASKS[sq]]
+
+
+def bishopAttacks(sq, occupied) -> int:
+    return DIAG_ATTACKS[sq][occupied & DIAG_MASKS[sq]] | ANTI_DIAG_ATTACKS[sq][occupied & ANTI_DIAG_MASKS[sq]]
+
+
+def queenAttacks(sq, occupied) -> int:
+    return rookAttacks(sq, occupied) | bishopAttacks(sq, occupied)
+
+
+# Moves are generated and searched as 16-bit ints: start square | end square << 6 | flag << 12.
+# Move objects are only built from them when the UI or notation needs one (getValidMoves, moveLog)
+QUIET = 0  # plain moves and plain captures, the captured piece is read off the board
+DOUBLE_PAWN_PUSH = 1
+CASTLE = 2
+EN_PASSANT = 3
+FIRST_PROMOTION = 4  # 4-7 promote to knight, bishop, rook, queen
+PROMOTION_FLAGS = {"N": 4, "B": 5, "R": 6, "Q": 7}
+FLAG_PROMOTIONS = {flag: piece for piece, flag in PROMOTION_FLAGS.items()}
+
+
+def encodeMove(startSq, endSq, flag=QUIET) -> int:
+    return startSq | endSq << 6 | flag << 12
+
+
+def codeNotation(code) -> str:
+    """
+    Coordinate notation of a packed move, e.g. "e2e4" or "e7e8q", without building a Move
+    """
+    startSq, endSq, flag = code & 63, (code >> 6) & 63, code >> 12
+    notation = (Move.colsToFiles[startSq & 7] + Move.rowsToRanks[startSq >> 3] +
+                Move.colsToFiles[endSq & 7] + Move.rowsToRanks[endSq >> 3])
+    if flag in FLAG_PROMOTIONS:
+        notation += FLAG_PROMOTIONS[flag].lower()
+    return notation
 
 
 class Move:
+    __slots__ = ("startRow", "startCol", "endRow", "endCol", "pieceMoved", "pieceCaptured", "isPawnPromo",
+                 "promotionPiece", "isEnpassantMove", "isCastleMove", "isCapture", "moveID", "code")
     ranksToRows = {"1": 7, "2": 6, "3": 5, "4": 4, "5": 3, "6": 2, "7": 1, "8": 0}
     rowsToRanks = {v: k for k, v in ranksToRows.items()}
     filesToCols = {"a": 0, "b": 1, "c": 2, "d": 3, "e": 4, "f": 5, "g": 6, "h": 7}
     colsToFiles = {v: k for k, v in filesToCols.items()}
+    promotionCodes = {"Q": 0, "R": 1, "B": 2, "N": 3}
+
+    def __init__(self, start, end, board, isEnpassantMove=False, isCastleMove=False, promotionPiece="Q"):
+        self.setUp(start, end, board[start[0]][start[1]], board[end[0]][end[1]], isEnpassantMove, isCastleMove,
+                   promotionPiece)
 
-    def __init__(self, start, end, board, isEnpassantMove=False, isCastleMove=False):
+    """
+    Builds the Move for a packed move code, reading the pieces off the board before the move is made
+    """
+
+    @classmethod
+    def fromCode(cls, code, board):
+        startSq, endSq, flag = code & 63, (code >> 6) & 63, code >> 12
+        return cls((startSq >> 3, startSq & 7), (endSq >> 3, endSq & 7), board, flag == EN_PASSANT, flag == CASTLE,
+                   FLAG_PROMOTIONS.get(flag, "Q"))
+
+    """
+    Same as fromCode for a move that has already been played, so the pieces come from the game history instead
+    """
+
+    @classmethod
+    def fromRecord(cls, code, pieceMoved, pieceCaptured):
+        startSq, endSq, flag = code & 63, (code >> 6) & 63, code >> 12
+        move = cls.__new__(cls)
+        move.setUp((startSq >> 3, startSq & 7), (endSq >> 3, endSq & 7), pieceMoved, pieceCaptured,
+                   flag == EN_PASSANT, flag == CASTLE, FLAG_PROMOTIONS.get(flag, "Q"))
+        return move
+
+    def setUp(self, start, end, pieceMoved, pieceCaptured, isEnpassantMove, isCastleMove, promotionPiece):
         self.startRow = start[0]
         self.startCol = start[1]
         self.endRow = end[0]
         self.endCol = end[1]
-        self.pieceMoved = board[self.startRow][self.startCol]
-        self.pieceCaptured = board[self.endRow][self.endCol]
+        self.pieceMoved = pieceMoved
+        self.pieceCaptured = pieceCaptured
         # pawn promotion
         self.isPawnPromo = (self.pieceMoved == "wP" and self.endRow == 0) or (
                 self.pieceMoved == "bP" and self.endRow == 7)
+        self.promotionPiece = promotionPiece if self.isPawnPromo else None
         # en passant
         self.isEnpassantMove = isEnpassantMove
         if self.isEnpassantMove:
@@ -35,6 +304,19 @@ class Move:
         self.isCastleMove = isCastleMove
         self.isCapture = self.pieceCaptured != "--"
         self.moveID = self.startRow * 1000 + self.startCol * 100 + self.endRow * 10 + self.endCol
+        if self.isPawnPromo:  # queen promotions keep the plain id so a UI click still matches them
+            self.moveID += self.promotionCodes[promotionPiece] * 10000
+        if self.isPawnPromo:
+            flag = PROMOTION_FLAGS[promotionPiece]
+        elif isEnpassantMove:
+            flag = EN_PASSANT
+        elif isCastleMove:
+            flag = CASTLE
+        elif self.pieceMoved[1] == "P" and abs(self.startRow - self.endRow) == 2:
+            flag = DOUBLE_PAWN_PUSH
+        else:
+            flag = QUIET
+        self.code = encodeMove(self.startRow * 8 + self.startCol, self.endRow * 8 + self.endCol, flag)
 
     # Overriding equals method (this allows python to equate two different objects with the same value as equal)
     def __eq__(self, other):
@@ -44,7 +326,10 @@ class Move:
         return False
 
     def getChessNotation(self) -> str:
-        return self.getRankFile(self.startRow, self.startCol) + self.getRankFile(self.endRow, self.endCol)
+        notation = self.getRankFile(self.startRow, self.startCol) + self.getRankFile(self.endRow, self.endCol)
+        if self.isPawnPromo:
+            notation += self.promotionPiece.lower()
+        return notation
 
     def getRankFile(self, r, c) -> str:
         return self.colsToFiles[c] + self.rowsToRanks[r]
@@ -58,10 +343,11 @@ class Move:
         # pawn moves
         if self.pieceMoved[1] == "P":
             if self.isCapture:
-                return self.colsToFiles[self.startCol] + "x" + endSquare
-            else:
-                return endSquare
+                endSquare = self.colsToFiles[self.startCol] + "x" + endSquare
             # pawn promotions
+            if self.isPawnPromo:
+                endSquare += "=" + self.promotionPiece
+            return endSquare
 
         # checks (add +)
 
@@ -76,12 +362,15 @@ class Move:
         return moveString + endSquare
 
 
+STARTING_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+
 class GameState:
     def __init__(self):
         # 8x8 two-dimensional list. each element in the list has 2 characters.
         # the first is the color, the second is the type of piece.
         # "--" represents empty space
-        self.board = [
+        board = [
             ["bR", "bN", "bB", "bQ", "bK", "bB", "bN", "bR"],
             ["bP", "bP", "bP", "bP", "bP", "bP", "bP", "bP"],
             ["--", "--", "--", "--", "--", "--", "--", "--"],
@@ -91,313 +380,664 @@ class GameState:
             ["wP", "wP", "wP", "wP", "wP", "wP", "wP", "wP"],
             ["wR", "wN", "wB", "wQ", "wK", "wB", "wN", "wR"]
         ]
-        self.enpassantPossible = ()  # coordinate where the en passant capture is possible
-        self.enpassantPossibleLog = [self.enpassantPossible]  # so if we move a diff piece, the en passent is saved
-        self.currentCastlingRight = CastleRights(True, True, True, True)
-        self.castleRightsLog = [CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks,
-                                             self.currentCastlingRight.wqs, self.currentCastlingRight.bqs)]
+        self.setPosition(board, True, ALL_CASTLING, ())
+
+    """
+    Sets up the position as given, with an empty move history. Nothing is generated or checked here, so positions
+    are cheap to create in bulk; getValidMoves works out checkmate and stalemate when it is first called
+    """
+
+    def setPosition(self, board, whiteToMove, castlingRights, enpassantPossible, fullmoveNumber=1,
+                    halfmoveClock=0) -> None:
+        self.board = board
+        self.bitboards = {}  # one bitboard per piece, e.g. self.bitboards["wN"]
+        self.occupancy = {}  # all squares occupied by "w" or "b"
+        self.boardScore = 0  # sum of PIECE_SQUARE_SCORES for every piece on the board
+        self.syncBitboards()
+        self.enpassantPossible = enpassantPossible  # coordinate where the en passant capture is possible
+        self.castlingRights = castlingRights  # WHITE_KINGSIDE | WHITE_QUEENSIDE | ... bits still allowed
 
         self.moveFunction = {"P": self.getPawnMoves, "R": self.getRookMoves, "N": self.getKnightMoves,
                              "B": self.getBishopMoves, "Q": self.getQueenMoves, "K": self.getKingMoves}
-        self.whiteToMove = True
-        self.moveLog = []
-        self.whiteKingLocation = (7, 4)
-        self.blackKingLocation = (0, 4)
-        self.inCheck()
+        self.whiteToMove = whiteToMove
+        self.startPly = 2 * (fullmoveNumber - 1) + (0 if whiteToMove else 1)  # plies before the first position
+        # The undo stack, one record per move made: (move code, piece moved, piece captured) and then what the move
+        # overwrites, (castling rights, en passant square, halfmove clock, zobrist key) from before it
+        self.history = []
+        self.moveObjectLog = []  # Move objects for the start of history, filled in on demand by moveLog
+        kings = (self.bitboards["wK"], self.bitboards["bK"])
+        if not all(king and king & (king - 1) == 0 for king in kings):
+            raise ValueError("position needs exactly one king of each colour")
+        self.whiteKingLocation = divmod(kings[0].bit_length() - 1, 8)
+        self.blackKingLocation = divmod(kings[1].bit_length() - 1, 8)
+        self.zobristKey = self.computeZobristKey()  # updated incrementally by makeMove/undoMove
+        self.repetitionCounts = {self.zobristKey: 1}  # how often each position of the game so far has occurred
+        self.halfmoveClock = halfmoveClock  # plies since the last capture or pawn move, for the fifty-move rule
+        self.whiteAttacks = None  # attackMap("w") of the current position, None until it is asked for
+        self.blackAttacks = None
         self.checkmate = False
         self.stalemate = False
+        self.threefoldRepetition = False
+        self.fiftyMoveRule = False
+
+    """
+    Builds a GameState straight from a FEN string, without replaying any moves. Raises ValueError for any malformed
+    field. Castling rights whose king or rook isn't on its home square are dropped, since they could never be used
+    """
+
+    @classmethod
+    def from_fen(cls, fen) -> "GameState":
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError(f"FEN needs at least 4 fields: {fen!r}")
+        placement, turn, castling, enpassant = fields[:4]
+        ranks = placement.split("/")
+        if len(ranks) != 8 or turn not in ("w", "b"):
+            raise ValueError(f"malformed FEN: {fen!r}")
+        board = []
+        for rank in ranks:
+            row = []
+            for char in rank:
+                if char.isdigit():
+                    row += ["--"] * int(char)
+                elif char.upper() in "PNBRQK":
+                    row.append(("w" if char.isupper() else "b") + char.upper())
+                else:
+                    raise ValueError(f"unknown piece {char!r} in FEN: {fen!r}")
+            if len(row) != 8:
+                raise ValueError(f"rank {rank!r} is not 8 squares long in FEN: {fen!r}")
+            board.append(row)
+        if any(piece[1] == "P" for piece in board[0] + board[7]):
+            raise ValueError(f"pawn on the first or last rank in FEN: {fen!r}")
+
+        if castling != "-" and any(letter not in "KQkq" or castling.count(letter) > 1 for letter in castling):
+            raise ValueError(f"bad castling field {castling!r} in FEN: {fen!r}")
+        castlingRights = 0
+        for letter, bit in CASTLING_LETTERS:
+            kingSq, rookSq, colour = CASTLING_HOMES[bit]
+            if letter in castling and board[kingSq // 8][kingSq % 8] == colour + "K" and \
+                    board[rookSq // 8][rookSq % 8] == colour + "R":
+                castlingRights |= bit
+
+        if enpassant == "-":
+            enpassantPossible = ()
+        else:
+            # the square the pawn that just moved skipped: rank 6 when white is to move, rank 3 when black is
+            if len(enpassant) != 2 or enpassant[0] not in Move.filesToCols or \
+                    enpassant[1] != ("6" if turn == "w" else "3"):
+                raise ValueError(f"bad en passant square {enpassant!r} in FEN: {fen!r}")
+            row, col = Move.ranksToRows[enpassant[1]], Move.filesToCols[enpassant[0]]
+            pawnRow, pawn = (row + 1, "bP") if turn == "w" else (row - 1, "wP")
+            if board[pawnRow][col] != pawn or board[row][col] != "--":
+                raise ValueError(f"no pawn can have just skipped en passant square {enpassant!r} in FEN: {fen!r}")
+            enpassantPossible = (row, col)
+
+        try:
+            halfmoveClock = int(fields[4]) if len(fields) > 4 else 0
+            fullmoveNumber = int(fields[5]) if len(fields) > 5 else 1
+        except ValueError:
+            raise ValueError(f"bad move counters in FEN: {fen!r}") from None
+        if halfmoveClock < 0 or fullmoveNumber < 1:
+            raise ValueError(f"bad move counters in FEN: {fen!r}")
+        gs = cls.__new__(cls)
+        gs.setPosition(board, turn == "w", castlingRights, enpassantPossible, fullmoveNumber, halfmoveClock)
+        return gs
+
+    """
+    The current position as a FEN string
+    """
+
+    def to_fen(self) -> str:
+        ranks = []
+        for row in self.board:
+            rank, empty = "", 0
+            for piece in row:
+                if piece == "--":
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += piece[1] if piece[0] == "w" else piece[1].lower()
+            ranks.append(rank + (str(empty) if empty else ""))
+        castling = "".join(letter for letter, bit in CASTLING_LETTERS if self.castlingRights & bit) or "-"
+        if self.enpassantPossible:
+            enpassant = Move.colsToFiles[self.enpassantPossible[1]] + Move.rowsToRanks[self.enpassantPossible[0]]
+        else:
+            enpassant = "-"
+        fullmoveNumber = (self.startPly + len(self.history)) // 2 + 1
+        turn = "w" if self.whiteToMove else "b"
+        return f"{'/'.join(ranks)} {turn} {castling} {enpassant} {self.halfmoveClock} {fullmoveNumber}"
+
+    """
+    The moves played so far as Move objects. Only built when something (the UI, notation) asks for them,
+    the search itself never creates any
+    """
+
+    @property
+    def moveLog(self) -> list[Move]:
+        log = self.moveObjectLog
+        for record in self.history[len(log):]:
+            log.append(Move.fromRecord(record[0], record[1], record[2]))
+        return log
+
+    """
+    Rebuilds every bitboard (and the board score) from the board list. Only needed when the board is set up by hand,
+    makeMove/undoMove keep the two in sync themselves
+    """
+
+    def syncBitboards(self) -> None:
+        self.bitboards = {piece: 0 for piece in PIECES}
+        self.occupancy = {"w": 0, "b": 0}
+        self.boardScore = 0
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece != "--":
+                    self.bitboards[piece] |= squareBit(r, c)
+                    self.occupancy[piece[0]] |= squareBit(r, c)
+                    self.boardScore += PIECE_SQUARE_SCORES[piece][r * 8 + c]
+
+    """
+    Hashes the whole position from scratch. Same value makeMove/undoMove keep up to date in self.zobristKey
+    """
+
+    def computeZobristKey(self) -> int:
+        key = 0
+        for piece in PIECES:
+            pieces = self.bitboards[piece]
+            while pieces:
+                lsb = pieces & -pieces
+                key ^= ZOBRIST_PIECES[piece][lsb.bit_length() - 1]
+                pieces ^= lsb
+        if not self.whiteToMove:
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        key ^= CASTLING_KEYS[self.castlingRights]
+        if self.enpassantPossible:
+            key ^= ZOBRIST_ENPASSANT[self.enpassantPossible[1]]
+        return key
+
+    def placePiece(self, piece, sq) -> None:
+        bit = 1 << sq
+        self.board[sq >> 3][sq & 7] = piece
+        self.bitboards[piece] |= bit
+        self.occupancy[piece[0]] |= bit
+        self.zobristKey ^= ZOBRIST_PIECES[piece][sq]
+        self.boardScore += PIECE_SQUARE_SCORES[piece][sq]
+
+    def removePiece(self, piece, sq) -> None:
+        bit = 1 << sq
+        self.board[sq >> 3][sq & 7] = "--"
+        self.bitboards[piece] ^= bit
+        self.occupancy[piece[0]] ^= bit
+        self.zobristKey ^= ZOBRIST_PIECES[piece][sq]
+        self.boardScore -= PIECE_SQUARE_SCORES[piece][sq]
 
     def makeMove(self, move: Move) -> None:
-        self.board[move.startRow][move.startCol] = "--"
-        self.board[move.endRow][move.endCol] = move.pieceMoved
-        self.moveLog.append(move)  # log move
-        self.whiteToMove = not self.whiteToMove  # switch turns
-        # update king's position
-        if move.pieceMoved == "wK":
-            self.whiteKingLocation = (move.endRow, move.endCol)
-        elif move.pieceMoved == "bK":
-            self.blackKingLocation = (move.endRow, move.endCol)
+        self.makeMoveCode(move.code)
+
+    """
+    makeMove for a packed move code, what the search and perft use
+    """
 
+    def makeMoveCode(self, code) -> None:
+        startSq, endSq, flag = code & 63, (code >> 6) & 63, code >> 12
+        key = self.zobristKey
+        pieceMoved = self.board[startSq >> 3][startSq & 7]
+        if flag == EN_PASSANT:
+            pieceCaptured = "bP" if pieceMoved == "wP" else "wP"
+            self.removePiece(pieceCaptured, (startSq & 56) | (endSq & 7))  # start row, end column
+        else:
+            pieceCaptured = self.board[endSq >> 3][endSq & 7]
+            if pieceCaptured != "--":
+                self.removePiece(pieceCaptured, endSq)
+        self.removePiece(pieceMoved, startSq)
         #  Pawn promo
-        if move.isPawnPromo:
-            self.board[move.endRow][move.endCol] = move.pieceMoved[0] + "Q"
+        if flag >= 4:
+            self.placePiece(pieceMoved[0] + FLAG_PROMOTIONS[flag], endSq)
+        else:
+            self.placePiece(pieceMoved, endSq)
+        # log move, with everything undoMove can't work out from the move itself
+        self.history.append((code, pieceMoved, pieceCaptured, self.castlingRights, self.enpassantPossible,
+                             self.halfmoveClock, key))
+        self.whiteToMove = not self.whiteToMove  # switch turns
+        self.zobristKey ^= ZOBRIST_BLACK_TO_MOVE
+        # update king's position
+        if pieceMoved == "wK":
+            self.whiteKingLocation = (endSq >> 3, endSq & 7)
+        elif pieceMoved == "bK":
+            self.blackKingLocation = (endSq >> 3, endSq & 7)
 
         #  update enpassantPossible
-        if move.pieceMoved[1] == "P" and abs(move.startRow - move.endRow) == 2:
-            self.enpassantPossible = ((move.endRow + move.startRow) // 2, move.startCol)
+        if self.enpassantPossible:
+            self.zobristKey ^= ZOBRIST_ENPASSANT[self.enpassantPossible[1]]
+        if flag == DOUBLE_PAWN_PUSH:
+            self.enpassantPossible = ((startSq + endSq) >> 4, startSq & 7)
+            self.zobristKey ^= ZOBRIST_ENPASSANT[startSq & 7]
         else:
             self.enpassantPossible = ()
-        # makes undoing the move easier
-        self.enpassantPossibleLog.append(self.enpassantPossible)
-
-        #  Enpassant move
-        if move.isEnpassantMove:
-            self.board[move.startRow][move.endCol] = "--"
 
         # updates castling rights
-        self.updateCastleRights(move)
-        self.castleRightsLog.append(CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks,
-                                                 self.currentCastlingRight.wqs, self.currentCastlingRight.bqs))
+        rights = self.castlingRights
+        if rights:
+            newRights = rights & CASTLING_MASKS[startSq] & CASTLING_MASKS[endSq]
+            if newRights != rights:
+                self.zobristKey ^= CASTLING_KEYS[rights] ^ CASTLING_KEYS[newRights]
+                self.castlingRights = newRights
         # castle moves
-        if move.isCastleMove:
-            if move.endCol - move.startCol == 2:  # king side castle move
-                self.board[move.endRow][move.endCol - 1] = self.board[move.endRow][move.endCol + 1]  # moves rook
-                self.board[move.endRow][move.endCol + 1] = "--"  # removes old rook
+        if flag == CASTLE:
+            rook = pieceMoved[0] + "R"
+            if endSq > startSq:  # king side castle move
+                self.removePiece(rook, endSq + 1)  # removes old rook
+                self.placePiece(rook, endSq - 1)  # moves rook
             else:
-                self.board[move.endRow][move.endCol + 1] = self.board[move.endRow][move.endCol - 2]  # moves rook
-                self.board[move.endRow][move.endCol - 2] = "--"  # removes old rook
+                self.removePiece(rook, endSq - 2)  # removes old rook
+                self.placePiece(rook, endSq + 1)  # moves rook
+
+        # fifty-move rule and repetitions
+        self.halfmoveClock = 0 if pieceMoved[1] == "P" or pieceCaptured != "--" else self.halfmoveClock + 1
+        self.repetitionCounts[self.zobristKey] = self.repetitionCounts.get(self.zobristKey, 0) + 1
+        self.whiteAttacks = self.blackAttacks = None
 
     def undoMove(self) -> None:
-        if len(self.moveLog) != 0:
-            lastMove = self.moveLog.pop()
-            self.board[lastMove.startRow][lastMove.startCol] = lastMove.pieceMoved
-            self.board[lastMove.endRow][lastMove.endCol] = lastMove.pieceCaptured
+        if len(self.history) != 0:
+            code, pieceMoved, pieceCaptured, castlingRights, enpassantPossible, halfmoveClock, key = self.history.pop()
+            if len(self.moveObjectLog) > len(self.history):
+                self.moveObjectLog.pop()
+            self.repetitionCounts[self.zobristKey] -= 1
+            startSq, endSq, flag = code & 63, (code >> 6) & 63, code >> 12
+            if flag >= 4:
+                self.removePiece(pieceMoved[0] + FLAG_PROMOTIONS[flag], endSq)
+            else:
+                self.removePiece(pieceMoved, endSq)
+            self.placePiece(pieceMoved, startSq)
+            # undo en passant move
+            if flag == EN_PASSANT:
+                self.placePiece(pieceCaptured, (startSq & 56) | (endSq & 7))
+            elif pieceCaptured != "--":
+                self.placePiece(pieceCaptured, endSq)
             self.whiteToMove = not self.whiteToMove  # switch turns
             # update king's position
-            if lastMove.pieceMoved == "wK":
-                self.whiteKingLocation = (lastMove.startRow, lastMove.startCol)
-            elif lastMove.pieceMoved == "bK":
-                self.blackKingLocation = (lastMove.startRow, lastMove.startCol)
-
-            # undo en passant move
-            if lastMove.isEnpassantMove:
-                self.board[lastMove.endRow][lastMove.endCol] = "--"
-                self.board[lastMove.startRow][lastMove.endCol] = lastMove.pieceCaptured
-            self.enpassantPossibleLog.pop()
-            self.enpassantPossible = self.enpassantPossibleLog[-1]
+            if pieceMoved == "wK":
+                self.whiteKingLocation = (startSq >> 3, startSq & 7)
+            elif pieceMoved == "bK":
+                self.blackKingLocation = (startSq >> 3, startSq & 7)
 
-            # undo castling rights
-            self.castleRightsLog.pop()
-            castle_rights = copy.deepcopy(self.castleRightsLog[-1])
-            self.currentCastlingRight = castle_rights
+            self.enpassantPossible = enpassantPossible
+            self.castlingRights = castlingRights
+            self.halfmoveClock = halfmoveClock
 
             # undo castle move
-            if lastMove.isCastleMove:
-                if lastMove.endCol - lastMove.startCol == 2:  # king side
-                    self.board[lastMove.endRow][lastMove.endCol + 1] = self.board[lastMove.endRow][
-                        lastMove.endCol - 1]  # moves rook
-                    self.board[lastMove.endRow][lastMove.endCol - 1] = "--"  # removes old rook
+            if flag == CASTLE:
+                rook = pieceMoved[0] + "R"
+                if endSq > startSq:  # king side
+                    self.removePiece(rook, endSq - 1)  # removes moved rook
+                    self.placePiece(rook, endSq + 1)  # puts rook back
                 else:
-                    self.board[lastMove.endRow][lastMove.endCol - 2] = self.board[lastMove.endRow][
-                        lastMove.endCol + 1]  # moves rook
-                    self.board[lastMove.endRow][lastMove.endCol + 1] = "--"  # removes old rook
+                    self.removePiece(rook, endSq + 1)  # removes moved rook
+                    self.placePiece(rook, endSq - 2)  # puts rook back
+            self.zobristKey = key  # the pieces put back changed it too, but the old key is known
 
+            self.whiteAttacks = self.blackAttacks = None
             self.checkmate = False
             self.stalemate = False
+            self.threefoldRepetition = False
+            self.fiftyMoveRule = False
 
-    def updateCastleRights(self, move):
-        # Checks if king moved
-        if move.pieceMoved == "wK":
-            self.currentCastlingRight.wks = False
-            self.currentCastlingRight.wqs = False
-        elif move.pieceMoved == "bK":
-            self.currentCastlingRight.bks = False
-            self.currentCastlingRight.bqs = False
-
-        # Checks if rook moved
-        elif move.pieceMoved == "wR":
-            if move.startRow == 7:
-                if move.startCol == 0:  # left rook
-                    self.currentCastlingRight.wqs = False
-                elif move.startCol == 7:  # right rook
-                    self.currentCastlingRight.wks = False
-        elif move.pieceMoved == "bR":
-            if move.startRow == 0:
-                if move.startCol == 0:  # left rook
-                    self.currentCastlingRight.bqs = False
-                elif move.startCol == 7:  # right rook
-                    self.currentCastlingRight.bks = False
-
-        # Checks if rook taken
-        if move.pieceCaptured == "wR":
-            if move.endRow == 7:
-                if move.endCol == 0:
-                    self.currentCastlingRight.wqs = False
-                elif move.endCol == 7:
-                    self.currentCastlingRight.wks = False
-        elif move.pieceCaptured == "bR":
-            if move.endRow == 0:
-                if move.endCol == 0:
-                    self.currentCastlingRight.bqs = False
-                elif move.endCol == 7:
-                    self.currentCastlingRight.bks = False
-
-    # With checks in mind
-    def getValidMoves(self):
-        tempEnpassantPossible = self.enpassantPossible
-        tempCastleRights = CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks,
-                                        self.currentCastlingRight.wqs, self.currentCastlingRight.bqs)
-        # 1. generate all moves
-        moves = self.getAllPossibleMoves()
-        if self.whiteToMove:
-            self.getCastleMoves(self.whiteKingLocation[0], self.whiteKingLocation[1], moves)
-        else:
-            self.getCastleMoves(self.blackKingLocation[0], self.blackKingLocation[1], moves)
-        # 2. for each move, make the move
-        for i in range(len(moves) - 1, -1, -1):
-            self.makeMove(moves[i])
-            # 3. generate oppMoves and see if they attack you king
-            self.whiteToMove = not self.whiteToMove
-            if self.inCheck():
-                # 4. if they do attack you king, remove that invalid move
-                moves.remove(moves[i])
-            self.whiteToMove = not self.whiteToMove
+    """
+    Counts the leaf nodes of the legal move tree to the given depth. The counts are well known for standard
+    positions, so any mismatch points at a move generation bug (see perft.py)
+    """
+
+    def perft(self, depth) -> int:
+        if depth == 0:
+            return 1
+        moves = self.getLegalMoves()
+        if depth == 1:
+            return len(moves)
+        nodes = 0
+        for move in moves:
+            self.makeMoveCode(move)
+            nodes += self.perft(depth - 1)
+            self.undoMove()
+        return nodes
+
+    """
+    perft split by root move, e.g. {"e2e4": 600, ...}. Used to track down which move a wrong count comes from
+    """
+
+    def divide(self, depth) -> dict:
+        counts = {}
+        for move in self.getLegalMoves():
+            self.makeMoveCode(move)
+            counts[codeNotation(move)] = self.perft(depth - 1)
             self.undoMove()
+        return counts
+
+    """
+    Standard algebraic notation of a legal move, as PGN wants it: disambiguated, with + or # after checks.
+    validMoves are the legal moves of the current position
+    """
+
+    def sanNotation(self, move, validMoves) -> str:
+        if move.isCastleMove:
+            san = "O-O" if move.endCol == 6 else "O-O-O"
+        elif move.pieceMoved[1] == "P":
+            san = move.getRankFile(move.endRow, move.endCol)
+            if move.isCapture:
+                san = move.colsToFiles[move.startCol] + "x" + san
+            if move.isPawnPromo:
+                san += "=" + move.promotionPiece
+        else:
+            san = move.pieceMoved[1]
+            rivals = [other for other in validMoves if other.pieceMoved == move.pieceMoved and other != move and
+                      (other.endRow, other.endCol) == (move.endRow, move.endCol)]
+            if rivals:
+                if all(other.startCol != move.startCol for other in rivals):
+                    san += move.colsToFiles[move.startCol]
+                elif all(other.startRow != move.startRow for other in rivals):
+                    san += move.rowsToRanks[move.startRow]
+                else:
+                    san += move.getRankFile(move.startRow, move.startCol)
+            if move.isCapture:
+                san += "x"
+            san += move.getRankFile(move.endRow, move.endCol)
+        checkmate, stalemate = self.checkmate, self.stalemate
+        self.makeMove(move)
+        if self.inCheck():
+            self.getLegalMoves()
+            san += "#" if self.checkmate else "+"
+        self.undoMove()
+        self.checkmate, self.stalemate = checkmate, stalemate
+        return san
+
+    """
+    With checks in mind, as Move objects for the UI. The search uses getLegalMoves, which skips building them
+    """
+
+    def getValidMoves(self):
+        return [Move.fromCode(code, self.board) for code in self.getLegalMoves()]
+
+    """
+    Every legal move as a packed move code. Checkers and pins are worked out once for the position, then every piece
+    only generates moves that land inside its allowed mask, so nothing has to be made and undone to test it
+    """
+
+    def getLegalMoves(self):
+        moves, checkers = self.generateLegalMoves(False)
         if len(moves) == 0:  # either stalemate or checkmate
-            if self.inCheck():
+            if checkers:
                 self.checkmate = True
             else:
                 self.stalemate = True
         else:
             self.checkmate = False
             self.stalemate = False
-
-        self.enpassantPossible = tempEnpassantPossible
-        self.currentCastlingRight = tempCastleRights
+        # draws the players don't have to claim here, the game just ends
+        self.threefoldRepetition = self.repetitionCounts[self.zobristKey] >= 3
+        self.fiftyMoveRule = self.halfmoveClock >= 100 and not self.checkmate
         return moves
 
+    """
+    True when the current position already occurred earlier in the game (or earlier in the line being searched)
+    """
+
+    def isRepetition(self) -> bool:
+        return self.repetitionCounts[self.zobristKey] >= 2
+
+    """
+    Only the legal captures (en passant included) and promotions as move codes, for the quiescence search.
+    Unlike getLegalMoves this leaves checkmate/stalemate alone
+    """
+
+    def getCaptureMoves(self):
+        return self.generateLegalMoves(True)[0]
+
+    """
+    Shared by getLegalMoves and getCaptureMoves. Returns the move codes and the bitboard of pieces giving check
+    """
+
+    def generateLegalMoves(self, capturesOnly):
+        friendly, opponent = ("w", "b") if self.whiteToMove else ("b", "w")
+        kingRow, kingCol = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+        kingSq = kingRow * 8 + kingCol
+        occupied = self.occupancy["w"] | self.occupancy["b"]
+        attacked = self.attackMap(opponent)
+        checkers = self.attackersTo(kingSq, opponent, occupied) if attacked & (1 << kingSq) else 0
+        moves = []
+        if capturesOnly:
+            pieceTargets = self.occupancy[opponent]
+            pawnTargets = pieceTargets | PROMOTION_RANKS
+        else:
+            pieceTargets = pawnTargets = ALL_SQUARES
+        self.addMoves(kingSq, KING_ATTACKS[kingSq] & ~self.occupancy[friendly] & ~attacked & pieceTargets, moves)
+
+        if (checkers & (checkers - 1)) == 0:  # in double check only the king can move
+            if checkers:  # capture the checker or block the line between it and the king
+                allowed = checkers | BETWEEN[kingSq][checkers.bit_length() - 1]
+            else:
+                allowed = ALL_SQUARES
+                if not capturesOnly:
+                    self.getCastleMoves(kingSq, moves)
+            pinRays = self.getPinRays(kingSq, friendly, opponent, occupied)
+            for piece in PIECES:
+                if piece[0] == friendly and piece[1] != "K":
+                    pieceAllowed = allowed & (pawnTargets if piece[1] == "P" else pieceTargets)
+                    pieces = self.bitboards[piece]
+                    while pieces:
+                        lsb = pieces & -pieces
+                        sq = lsb.bit_length() - 1
+                        self.moveFunction[piece[1]](sq, moves, pieceAllowed & pinRays.get(sq, ALL_SQUARES))
+                        pieces ^= lsb
+        return moves, checkers
+
+    """
+    Finds our pieces that are the only thing standing between the king and an enemy slider. Each pinned square is
+    mapped to the squares it may still move to: along the pin, up to and including the pinning piece
+    """
+
+    def getPinRays(self, kingSq, friendly, opponent, occupied) -> dict:
+        pinRays = {}
+        bitboards = self.bitboards
+        enemies = self.occupancy[opponent]
+        # enemy sliders that would see the king if only enemy pieces could block them
+        pinners = (rookAttacks(kingSq, enemies) & (bitboards[opponent + "R"] | bitboards[opponent + "Q"])) | (
+                bishopAttacks(kingSq, enemies) & (bitboards[opponent + "B"] | bitboards[opponent + "Q"]))
+        while pinners:
+            lsb = pinners & -pinners
+            between = BETWEEN[kingSq][lsb.bit_length() - 1]
+            blockers = between & occupied
+            if blockers and (blockers & (blockers - 1)) == 0 and blockers & self.occupancy[friendly]:
+                pinRays[blockers.bit_length() - 1] = between | lsb
+            pinners ^= lsb
+        return pinRays
+
     def inCheck(self):
         if self.whiteToMove:
-            return self.squareUnderAttack(self.whiteKingLocation[0], self.whiteKingLocation[1])
+            return bool(self.bitboards["wK"] & self.attackMap("b"))
         else:
-            return self.squareUnderAttack(self.blackKingLocation[0], self.blackKingLocation[1])
-
-    def squareUnderAttack(self, r, c) -> bool:
-        self.whiteToMove = not self.whiteToMove
-        opponentMoves = self.getAllPossibleMoves()
-        self.whiteToMove = not self.whiteToMove
-        for move in opponentMoves:
-            if move.endRow == r and move.endCol == c:
-                return True
-        return False
+            return bool(self.bitboards["bK"] & self.attackMap("w"))
 
-    # looking at all moves
-    def getAllPossibleMoves(self) -> list[Move]:
-        moves = []
-        for r in range(len(self.board)):
-            for c in range(len(self.board[r])):
-                turn = self.board[r][c][0]  # w or b
-                if (turn == "w" and self.whiteToMove) or (turn == "b" and not self.whiteToMove):
-                    piece = self.board[r][c][1]
-                    self.moveFunction[piece](r, c, moves)  # calls respective function to the piece inputted
-        return moves
+    """
+    Looks backwards from the square: if e.g. a knight standing on sq could reach an enemy knight,
+    that enemy knight attacks sq. No move lists are generated
+    """
 
-    def getPawnMoves(self, r, c, moves) -> None:
-        if self.whiteToMove:
-            if self.board[r - 1][c] == "--":  # 1 square advance
-                moves.append(Move((r, c), (r - 1, c), self.board))
-                if r == 6 and self.board[r - 2][c] == "--":  # 2 square advance. Inside other if statement since if
-                    # if you cant even move one square forward, you won't be able to with 2 squares forward.
-                    moves.append(Move((r, c), (r - 2, c), self.board))
-            # This if stops pawns from capturing pawns from one side of the board to the other... kinda cool idea ngl
-            if c - 1 >= 0:  # captures to the left
-                if self.board[r - 1][c - 1][0] == "b":  # enemy piece to capture on the left diagonal
-                    moves.append(Move((r, c), (r - 1, c - 1), self.board))
-                elif (r - 1, c - 1) == self.enpassantPossible:
-                    moves.append(Move((r, c), (r - 1, c - 1), self.board, isEnpassantMove=True))
-
-            # DON'T use elif here since this will ignore any possible captures to the right of pawns
-            if c + 1 <= 7:  # captures to the right
-                if self.board[r - 1][c + 1][0] == "b":  # enemy piece to capture on the right diagonal
-                    moves.append(Move((r, c), (r - 1, c + 1), self.board))
-                elif (r - 1, c + 1) == self.enpassantPossible:
-                    moves.append(Move((r, c), (r - 1, c + 1), self.board, isEnpassantMove=True))
+    def isSquareAttacked(self, sq, attacker, occupied=None) -> bool:
+        bitboards = self.bitboards
+        if attacker == "w":
+            pawns, knights, king = bitboards["wP"], bitboards["wN"], bitboards["wK"]
+            diagonals = bitboards["wB"] | bitboards["wQ"]
+            straights = bitboards["wR"] | bitboards["wQ"]
+            pawnAttacks = PAWN_ATTACKS["b"][sq]
+        else:
+            pawns, knights, king = bitboards["bP"], bitboards["bN"], bitboards["bK"]
+            diagonals = bitboards["bB"] | bitboards["bQ"]
+            straights = bitboards["bR"] | bitboards["bQ"]
+            pawnAttacks = PAWN_ATTACKS["w"][sq]
+        if pawnAttacks & pawns or KNIGHT_ATTACKS[sq] & knights or KING_ATTACKS[sq] & king:
+            return True
+        if occupied is None:
+            occupied = self.occupancy["w"] | self.occupancy["b"]
+        return bool(bishopAttacks(sq, occupied) & diagonals or rookAttacks(sq, occupied) & straights)
+
+    """
+    Bitboard of every square the attacker's pieces hit, worked out once per position and kept until the next
+    makeMove/undoMove. The other side's king is left off the occupancy, so a slider checking it also covers the
+    squares behind it: the king can't step back along the line. That makes it exactly the squares that king may not
+    move to, and its own square is set when it is in check
+    """
+
+    def attackMap(self, attacker) -> int:
+        if attacker == "w":
+            if self.whiteAttacks is None:
+                self.whiteAttacks = self.computeAttackMap("w")
+            return self.whiteAttacks
+        if self.blackAttacks is None:
+            self.blackAttacks = self.computeAttackMap("b")
+        return self.blackAttacks
+
+    def computeAttackMap(self, attacker) -> int:
+        bitboards = self.bitboards
+        defender = "b" if attacker == "w" else "w"
+        occupied = (self.occupancy["w"] | self.occupancy["b"]) ^ bitboards[defender + "K"]
+        pawns = bitboards[attacker + "P"]
+        if attacker == "w":  # all pawns at once: white captures towards row 0, black towards row 7
+            attacks = (pawns & NOT_A_FILE) >> 9 | (pawns & NOT_H_FILE) >> 7
+        else:
+            attacks = ((pawns & NOT_A_FILE) << 7 | (pawns & NOT_H_FILE) << 9) & ALL_SQUARES
+        attacks |= KING_ATTACKS[bitboards[attacker + "K"].bit_length() - 1]
+        pieces = bitboards[attacker + "N"]
+        while pieces:
+            lsb = pieces & -pieces
+            attacks |= KNIGHT_ATTACKS[lsb.bit_length() - 1]
+            pieces ^= lsb
+        pieces = bitboards[attacker + "B"] | bitboards[attacker + "Q"]
+        while pieces:
+            lsb = pieces & -pieces
+            attacks |= bishopAttacks(lsb.bit_length() - 1, occupied)
+            pieces ^= lsb
+        pieces = bitboards[attacker + "R"] | bitboards[attacker + "Q"]
+        while pieces:
+            lsb = pieces & -pieces
+            attacks |= rookAttacks(lsb.bit_length() - 1, occupied)
+            pieces ^= lsb
+        return attacks
+
+    """
+    Bitboard of every attacker pieces of one colour that hit sq, given the occupancy
+    """
+
+    def attackersTo(self, sq, attacker, occupied) -> int:
+        bitboards = self.bitboards
+        defender = "b" if attacker == "w" else "w"
+        return (PAWN_ATTACKS[defender][sq] & bitboards[attacker + "P"]) | (
+                KNIGHT_ATTACKS[sq] & bitboards[attacker + "N"]) | (KING_ATTACKS[sq] & bitboards[attacker + "K"]) | (
+                bishopAttacks(sq, occupied) & (bitboards[attacker + "B"] | bitboards[attacker + "Q"])) | (
+                rookAttacks(sq, occupied) & (bitboards[attacker + "R"] | bitboards[attacker + "Q"]))
 
+    """
+    Adds a move from sq to every square set in the targets bitboard
+    """
+
+    def addMoves(self, sq, targets, moves) -> None:
+        while targets:
+            lsb = targets & -targets
+            moves.append(sq | (lsb.bit_length() - 1) << 6)
+            targets ^= lsb
+
+    """
+    Same as addMoves but a pawn reaching the last rank adds one move per piece it can promote to
+    """
+
+    def addPawnMoves(self, sq, targets, moves) -> None:
+        while targets:
+            lsb = targets & -targets
+            move = sq | (lsb.bit_length() - 1) << 6
+            if lsb & PROMOTION_RANKS:
+                for promotionPiece in PROMOTION_PIECES:
+                    moves.append(move | PROMOTION_FLAGS[promotionPiece] << 12)
+            else:
+                moves.append(move)
+            targets ^= lsb
+
+    # allowed limits where the piece may land (check evasions and pins). The default allows every square
+    def getPawnMoves(self, sq, moves, allowed=ALL_SQUARES) -> None:
+        if self.whiteToMove:
+            friendly, opponent, step, startRow = "w", "b", -8, 6
         else:  # black pawn moves
-            if self.board[r + 1][c] == "--":
-                moves.append(Move((r, c), (r + 1, c), self.board))
-                if r == 1 and self.board[r + 2][c] == "--":
-                    moves.append(Move((r, c), (r + 2, c), self.board))
-            if c + 1 >= 0:
-                if self.board[r + 1][c - 1][0] == "w":
-                    moves.append(Move((r, c), (r + 1, c - 1), self.board))
-                elif (r + 1, c - 1) == self.enpassantPossible:
-                    moves.append(Move((r, c), (r + 1, c - 1), self.board, isEnpassantMove=True))
-            if c + 1 <= 7:
-                if self.board[r + 1][c + 1][0] == "w":
-                    moves.append(Move((r, c), (r + 1, c + 1), self.board))
-                elif (r + 1, c + 1) == self.enpassantPossible:
-                    moves.append(Move((r, c), (r + 1, c + 1), self.board, isEnpassantMove=True))
-
-    def getRookMoves(self, r, c, moves) -> None:
-        direction = [(0, 1), (0, -1), (-1, 0), (1, 0)]
+            friendly, opponent, step, startRow = "b", "w", 8, 1
+        occupied = self.occupancy["w"] | self.occupancy["b"]
+        if not occupied & (1 << (sq + step)):  # 1 square advance
+            self.addPawnMoves(sq, (1 << (sq + step)) & allowed, moves)
+            # 2 square advance. Inside other if statement since if you cant even move one square forward,
+            # you won't be able to with 2 squares forward.
+            if sq >> 3 == startRow and not occupied & (1 << (sq + 2 * step)) and allowed & (1 << (sq + 2 * step)):
+                moves.append(encodeMove(sq, sq + 2 * step, DOUBLE_PAWN_PUSH))
+        # the attack table already stops pawns from capturing from one side of the board to the other
+        captures = PAWN_ATTACKS[friendly][sq]
+        self.addPawnMoves(sq, captures & self.occupancy[opponent] & allowed, moves)
+        if self.enpassantPossible:
+            enpassantSq = self.enpassantPossible[0] * 8 + self.enpassantPossible[1]
+            if captures & (1 << enpassantSq) and self.isEnpassantLegal(sq):
+                moves.append(encodeMove(sq, enpassantSq, EN_PASSANT))
+
+    """
+    En passant removes two pieces from a line at once, which the pin masks can't see (e.g. king and rook on the
+    same rank as both pawns), so the capture is simply played out on the occupancy bitboard
+    """
+
+    def isEnpassantLegal(self, sq) -> bool:
+        epRow, epCol = self.enpassantPossible
         opponent = "b" if self.whiteToMove else "w"
+        kingRow, kingCol = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+        capturedPawn = 1 << ((sq & 56) | epCol)
+        occupied = ((self.occupancy["w"] | self.occupancy["b"]) ^ (1 << sq) ^ capturedPawn) | squareBit(epRow, epCol)
+        return not self.attackersTo(kingRow * 8 + kingCol, opponent, occupied) & ~capturedPawn
+
+    def getRookMoves(self, sq, moves, allowed=ALL_SQUARES) -> None:
         friendly = "w" if self.whiteToMove else "b"
-        for d in direction:
-            dr, dc = d[0], d[1]
-            for i in range(1, 8):
-                new_r, new_c = r + dr * i, c + dc * i
-                if 0 <= new_r < 8 and 0 <= new_c < 8:
-                    if self.board[new_r][new_c][0] == opponent:
-                        moves.append(Move((r, c), (new_r, new_c), self.board))
-                        break
-                    elif self.board[new_r][new_c][0] == friendly:
-                        break
-                    moves.append(Move((r, c), (new_r, new_c), self.board))
-                else:
-                    break
+        occupied = self.occupancy["w"] | self.occupancy["b"]
+        self.addMoves(sq, rookAttacks(sq, occupied) & ~self.occupancy[friendly] & allowed, moves)
 
-    def getBishopMoves(self, r, c, moves) -> None:
-        direction = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
-        opponent = "b" if self.whiteToMove else "w"
+    def getBishopMoves(self, sq, moves, allowed=ALL_SQUARES) -> None:
         friendly = "w" if self.whiteToMove else "b"
-        for d in direction:
-            dr, dc = d[0], d[1]
-            for i in range(1, 8):
-                new_r, new_c = r + dr * i, c + dc * i
-                if 0 <= new_r < 8 and 0 <= new_c < 8:
-                    if self.board[new_r][new_c][0] == opponent:
-                        moves.append(Move((r, c), (new_r, new_c), self.board))
-                        break
-                    elif self.board[new_r][new_c][0] == friendly:
-                        break
-                    moves.append(Move((r, c), (new_r, new_c), self.board))
-                else:
-                    break
+        occupied = self.occupancy["w"] | self.occupancy["b"]
+        self.addMoves(sq, bishopAttacks(sq, occupied) & ~self.occupancy[friendly] & allowed, moves)
 
-    def getKnightMoves(self, r, c, moves) -> None:
-        direction = [(-2, -1), (-2, 1), (-1, -2), (-1, 2), (2, -1), (2, 1), (1, -2), (1, 2)]
+    def getKnightMoves(self, sq, moves, allowed=ALL_SQUARES) -> None:
         friendly = "w" if self.whiteToMove else "b"
-        for x, y in direction:
-            if 0 <= r + x <= 7 and 0 <= c + y <= 7:
-                if self.board[r + x][c + y][0] != friendly:
-                    moves.append(Move((r, c), (r + x, c + y), self.board))
+        self.addMoves(sq, KNIGHT_ATTACKS[sq] & ~self.occupancy[friendly] & allowed, moves)
 
-    def getQueenMoves(self, r, c, moves) -> None:
-        self.getRookMoves(r, c, moves)
-        self.getBishopMoves(r, c, moves)
+    def getQueenMoves(self, sq, moves, allowed=ALL_SQUARES) -> None:
+        friendly = "w" if self.whiteToMove else "b"
+        occupied = self.occupancy["w"] | self.occupancy["b"]
+        self.addMoves(sq, queenAttacks(sq, occupied) & ~self.occupancy[friendly] & allowed, moves)
 
-    def getKingMoves(self, r, c, moves):
-        directions = [(-1, -1), (-1, 0), (-1, 1), (1, -1), (1, 0), (1, 1), (0, -1), (0, 1)]
+    def getKingMoves(self, sq, moves, allowed=ALL_SQUARES):
         friendly = "w" if self.whiteToMove else "b"
-        for x, y in directions:
-            newRow, newCol = r + x, c + y
-            if 0 <= newRow <= 7 and 0 <= newCol <= 7:
-                if self.board[newRow][newCol][0] != friendly:
-                    moves.append(Move((r, c), (newRow, newCol), self.board))
+        self.addMoves(sq, KING_ATTACKS[sq] & ~self.occupancy[friendly] & allowed, moves)
 
     """
-    Generate all valid castle moves for the king at (r,c) and add them to the list of moves
+    Generate all valid castle moves for the king on sq and add them to the list of moves.
+    Only called when the king is not in check (getLegalMoves already knows that from the checkers)
     """
 
-    def getCastleMoves(self, r, c, moves):
-        if self.squareUnderAttack(r, c):
-            return  # can't castle when in check
-        if (self.whiteToMove and self.currentCastlingRight.wks) or (
-                not self.whiteToMove and self.currentCastlingRight.bks):
-            self.getKingsideCastleMoves(r, c, moves)
-        if (self.whiteToMove and self.currentCastlingRight.wqs) or (
-                not self.whiteToMove and self.currentCastlingRight.bqs):
-            self.getQueensideCastleMoves(r, c, moves)
+    def getCastleMoves(self, sq, moves):
+        if self.castlingRights & (WHITE_KINGSIDE if self.whiteToMove else BLACK_KINGSIDE):
+            self.getKingsideCastleMoves(sq, moves)
+        if self.castlingRights & (WHITE_QUEENSIDE if self.whiteToMove else BLACK_QUEENSIDE):
+            self.getQueensideCastleMoves(sq, moves)
 
-    def getKingsideCastleMoves(self, r, c, moves):
+    def getKingsideCastleMoves(self, sq, moves):
         # no need to check if king exits the board since we know king hasn't moved yet or else castle option is False
-        if self.board[r][c + 1] == "--" and self.board[r][c + 2] == "--":
-            if not self.squareUnderAttack(r, c + 1) and not self.squareUnderAttack(r, c + 2):
-                moves.append(Move((r, c), (r, c + 2), self.board, isCastleMove=True))
-
-    def getQueensideCastleMoves(self, r, c, moves):
-        if self.board[r][c - 1] == "--" and self.board[r][c - 2] == "--" and self.board[r][c - 3] == "--":
-            # don't have to check if 3rd squareUnderAttack since king doesn't pass through there
-            if not self.squareUnderAttack(r, c - 1) and not self.squareUnderAttack(r, c - 2):
-                moves.append(Move((r, c), (r, c - 2), self.board, isCastleMove=True))
+        occupied = self.occupancy["w"] | self.occupancy["b"]
+        if not (occupied | self.attackMap("b" if self.whiteToMove else "w")) & (0b11 << (sq + 1)):
+            moves.append(encodeMove(sq, sq + 2, CASTLE))
+
+    def getQueensideCastleMoves(self, sq, moves):
+        occupied = self.occupancy["w"] | self.occupancy["b"]
+        # the 3rd square only has to be empty, the king doesn't pass through there
+        if not occupied & (0b111 << (sq - 3)) and not self.attackMap("b" if self.whiteToMove else "w") & (
+                0b11 << (sq - 2)):
+            moves.append(encodeMove(sq, sq - 2, CASTLE))
@@ -0,0 +1,187 @@
+# Opening book for ChessAI.
+# A book is a file of 16-byte big-endian records sorted by key, laid out like a Polyglot book:
+#   key     8 bytes  GameState.zobristKey of the position
+#   move    2 bytes  packed move code (ChessEngine.encodeMove)
+#   weight  2 bytes  how often the move should be picked, relative to the other moves of the position
+#   learn   4 bytes  unused, always 0
+# Keys and moves are this engine's own, so Polyglot's .bin books can't be read directly. The file is memory-mapped
+# and binary searched, so opening a book reads nothing up front however large it is.
+#
+#   python OpeningBook.py openings.pgn -o book.bin                 build a book from the first 16 plies of every game
+#   python OpeningBook.py openings.pgn -o book.bin --plies 24      ... or more of them
+#   python OpeningBook.py --probe book.bin "<fen>"                 list the book moves of a position
+
+import argparse
+import mmap
+import os
+import random
+import re
+import struct
+import sys
+
+import ChessEngine
+
+ENTRY = struct.Struct(">QHHI")
+DEFAULT_PLIES = 16
+MAX_WEIGHT = 0xFFFF
+
+
+class OpeningBook:
+    """
+    Read-only view of a book file. Keep one open for as long as it is used, lookups only touch the pages they need
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        self.entries = size // ENTRY.size
+        # mmap can't map an empty file, and an empty book simply never has a move
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.entries else b""
+
+    def keyAt(self, index) -> int:
+        return struct.unpack_from(">Q", self.data, index * ENTRY.size)[0]
+
+    def probe(self, key) -> list[tuple[int, int]]:
+        """
+        (move code, weight) for every book move of the position with this key, [] when it isn't in the book
+        """
+        low, high = 0, self.entries
+        while low < high:  # first entry with this key
+            middle = (low + high) // 2
+            if self.keyAt(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        moves = []
+        for index in range(low, self.entries):
+            entryKey, move, weight, _ = ENTRY.unpack_from(self.data, index * ENTRY.size)
+            if entryKey != key:
+                break
+            moves.append((move, weight))
+        return moves
+
+    def pickMove(self, key, legalMoves=None, rng=random):
+        """
+        A book move for the position picked at random in proportion to the weights, or None when there is none.
+        Moves missing from legalMoves (a list of move codes) are skipped, which guards against hash collisions
+        """
+        moves = [(move, weight) for move, weight in self.probe(key)
+                 if weight > 0 and (legalMoves is None or move in legalMoves)]
+        if not moves:
+            return None
+        return rng.choices([move for move, _ in moves], weights=[weight for _, weight in moves])[0]
+
+    def close(self) -> None:
+        if self.entries:
+            self.data.close()
+        self.file.close()
+
+
+def writeBook(path, weights) -> int:
+    """
+    Writes {(key, move code): weight} as a book file. Weights above what fits in 16 bits are scaled down per
+    position, keeping their proportions. Returns the number of entries written
+    """
+    byKey = {}
+    for (key, move), weight in weights.items():
+        byKey.setdefault(key, []).append((move, weight))
+    with open(path, "wb") as bookFile:
+        entries = 0
+        for key in sorted(byKey):
+            moves = byKey[key]
+            heaviest = max(weight for _, weight in moves)
+            scale = MAX_WEIGHT / heaviest if heaviest > MAX_WEIGHT else 1
+            for move, weight in sorted(moves, key=lambda entry: -entry[1]):
+                bookFile.write(ENTRY.pack(key, move, max(1, int(weight * scale)), 0))
+                entries += 1
+    return entries
+
+
+"""
+The SAN move lists of every game in a PGN text. Comments, variations, NAGs and annotations are skipped
+"""
+
+
+def readPgnGames(text) -> list[list[str]]:
+    text = re.sub(r"^\[.*\]\s*$", "", text, flags=re.MULTILINE)  # tag pairs
+    text = re.sub(r"\{[^}]*\}|;[^\n]*", " ", text)  # comments
+    while "(" in text:
+        stripped = re.sub(r"\([^()]*\)", " ", text)  # innermost variations first
+        if stripped == text:
+            break
+        text = stripped
+    games, moves = [], []
+    for token in text.split():
+        token = re.sub(r"^\d+\.+", "", token)  # move numbers, also when glued to the move ("1.e4")
+        if not token or token.startswith("$"):
+            continue
+        if token in ("1-0", "0-1", "1/2-1/2", "*"):
+            games.append(moves)
+            moves = []
+        else:
+            moves.append(token.rstrip("!?"))
+    if moves:
+        games.append(moves)
+    return games
+
+
+def sanKey(san) -> str:
+    return san.rstrip("+#").replace("0", "O")
+
+
+def buildWeights(games, plies=DEFAULT_PLIES) -> dict:
+    """
+    Counts how often each move was played in each position over the first plies of the games. A game stops
+    counting at the first move that isn't legal or can't be read
+    """
+    weights = {}
+    for sanMoves in games:
+        gs = ChessEngine.GameState()
+        for san in sanMoves[:plies]:
+            validMoves = gs.getValidMoves()
+            played = next((move for move in validMoves if sanKey(gs.sanNotation(move, validMoves)) == sanKey(san)),
+                          None)
+            if played is None:
+                break
+            weights[(gs.zobristKey, played.code)] = weights.get((gs.zobristKey, played.code), 0) + 1
+            gs.makeMove(played)
+    return weights
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Build or inspect an opening book for ChessAI")
+    parser.add_argument("pgn", nargs="*", help="PGN files to build the book from")
+    parser.add_argument("-o", "--output", help="book file to write")
+    parser.add_argument("--plies", type=int, default=DEFAULT_PLIES, help="plies of every game that go in the book")
+    parser.add_argument("--probe", nargs=2, metavar=("BOOK", "FEN"), help="list the book moves of a position")
+    args = parser.parse_args(argv)
+
+    if args.probe:
+        bookPath, fen = args.probe
+        gs = ChessEngine.GameState.from_fen(fen)
+        book = OpeningBook(bookPath)
+        moves = book.probe(gs.zobristKey)
+        book.close()
+        total = sum(weight for _, weight in moves)
+        for move, weight in moves:
+            print(f"{ChessEngine.codeNotation(move)}  weight {weight:>5}  {100 * weight / total:5.1f}%")
+        if not moves:
+            print("not in book")
+        return 0
+
+    if not args.pgn or not args.output:
+        parser.error("building a book needs PGN files and -o")
+    games = []
+    for pgnPath in args.pgn:
+        with open(pgnPath) as pgnFile:
+            games += readPgnGames(pgnFile.read())
+    weights = buildWeights(games, args.plies)
+    entries = writeBook(args.output, weights)
+    print(f"{len(games)} games, {entries} book entries, {len({key for key, _ in weights})} positions "
+          f"written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,473 @@
+# Endgame tablebases for ChessAI.
+# Every position of an ending (say king and rook against king) gets its exact result: a draw, or mate in n plies
+# for one side with best play. The tables are made offline by retrograde analysis over GameState's own move
+# generation and looked up by findBestMove, which then plays perfectly instead of searching.
+#
+# One file per material signature, tablebases/KRvK.tb. After a 16-byte header (magic and signature) it holds one
+# byte per position:
+#   0        draw
+#   1-127    the side to move mates in that many plies
+#   128+n    the side to move is mated in n plies (128 is checkmate on the board)
+#   255      not a legal position
+# Positions are stored with the stronger side as white, and the white king moved by symmetry to a1-d1-d4 (10
+# squares) or, with pawns on the board, to files a-d (32 squares). The index is then
+#   (side to move * king squares + king square index) * 64^(pieces - 1) + the other squares in base 64
+# with the pieces ordered white king, white Q R B N P, black king, black Q R B N P. Castling and en passant are
+# left out, positions that have them are never probed. Since the generator can't score en passant replies either,
+# endings with pawns on both sides (KPvKP) aren't generated.
+#
+#   python Tablebase.py KQvK KRvK KPvK        generate tables, and first any smaller ones they convert into
+#   python Tablebase.py --all 3               every ending with up to 3 pieces
+#   python Tablebase.py --probe "<fen>"       result of a position
+
+import argparse
+import itertools
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+
+import ChessEngine
+
+TABLEBASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tablebases")
+MAGIC = b"CTB1"
+HEADER = struct.Struct(">4s12s")
+PIECE_ORDER = "QRBNP"  # strongest first
+PIECE_VALUES = {"Q": 9, "R": 5, "B": 3, "N": 3, "P": 1}
+DRAW, LOSS, ILLEGAL = 0, 128, 255
+WIN_RESULT, DRAW_RESULT, LOSS_RESULT = 1, 0, -1
+TRIVIAL_DRAWS = {"KvK", "KBvK", "KNvK"}  # no mate is possible, so there is nothing to store
+MAX_PIECES = 4
+
+
+def _buildSymmetryTables():
+    transpose = [(7 - sq % 8) * 8 + (7 - sq // 8) for sq in range(64)]  # mirror in the a1-h8 diagonal
+    pawnlessKings, pawnKings = {}, {}
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        if col <= 3:
+            pawnKings[sq] = len(pawnKings)
+        if col <= 3 and 7 - row <= col:  # a1-d1-d4 triangle
+            pawnlessKings[sq] = len(pawnlessKings)
+    return transpose, pawnlessKings, pawnKings
+
+
+TRANSPOSE, PAWNLESS_KING_INDEX, PAWN_KING_INDEX = _buildSymmetryTables()
+PAWNLESS_KING_SQUARES = sorted(PAWNLESS_KING_INDEX, key=PAWNLESS_KING_INDEX.get)
+PAWN_KING_SQUARES = sorted(PAWN_KING_INDEX, key=PAWN_KING_INDEX.get)
+
+
+def sideStrength(letters):
+    return sum(PIECE_VALUES[letter] for letter in letters), [-PIECE_ORDER.index(letter) for letter in letters]
+
+
+def canonicalSignature(whiteLetters, blackLetters) -> str:
+    """
+    Signature of the table that holds these pieces, e.g. "KRvKP", stronger side first
+    """
+    whiteLetters = "".join(sorted(whiteLetters, key=PIECE_ORDER.index))
+    blackLetters = "".join(sorted(blackLetters, key=PIECE_ORDER.index))
+    if sideStrength(blackLetters) > sideStrength(whiteLetters):
+        whiteLetters, blackLetters = blackLetters, whiteLetters
+    return "K" + whiteLetters + "vK" + blackLetters
+
+
+def hasEnpassant(signature) -> bool:
+    """
+    True when both sides have pawns, so a double push can be answered en passant
+    """
+    whiteLetters, blackLetters = signature[1:].split("vK")
+    return "P" in whiteLetters and "P" in blackLetters
+
+
+class TableLayout:
+    """
+    Piece list and index arithmetic of one signature
+    """
+
+    def __init__(self, signature):
+        self.signature = signature
+        whiteLetters, blackLetters = signature[1:].split("vK")
+        self.pieces = (["wK"] + ["w" + letter for letter in whiteLetters] +
+                       ["bK"] + ["b" + letter for letter in blackLetters])
+        self.hasPawns = "P" in signature
+        self.kingSquares = PAWN_KING_SQUARES if self.hasPawns else PAWNLESS_KING_SQUARES
+        self.kingIndex = PAWN_KING_INDEX if self.hasPawns else PAWNLESS_KING_INDEX
+        self.others = 64 ** (len(self.pieces) - 1)
+        self.size = 2 * len(self.kingSquares) * self.others
+
+    def index(self, whiteToMove, squares) -> int:
+        """
+        Index of a position given in this table's orientation (stronger side white), squares in self.pieces order
+        """
+        kingSq = squares[0]
+        if self.hasPawns:
+            if kingSq & 7 > 3:
+                squares = [sq ^ 7 for sq in squares]
+        else:
+            if kingSq & 7 > 3:
+                squares = [sq ^ 7 for sq in squares]
+            if squares[0] >> 3 < 4:
+                squares = [sq ^ 56 for sq in squares]
+            if squares[0] not in self.kingIndex:
+                squares = [TRANSPOSE[sq] for sq in squares]
+        index = 0
+        for sq in reversed(squares[1:]):
+            index = index * 64 + sq
+        return ((0 if whiteToMove else 1) * len(self.kingSquares) + self.kingIndex[squares[0]]) * self.others + index
+
+    def decode(self, index):
+        rest = index % self.others
+        kingPart = index // self.others
+        whiteToMove = kingPart < len(self.kingSquares)
+        squares = [self.kingSquares[kingPart % len(self.kingSquares)]]
+        for _ in range(len(self.pieces) - 1):
+            squares.append(rest % 64)
+            rest //= 64
+        return whiteToMove, squares
+
+
+def positionKey(gs, ignoreEnpassant=False):
+    """
+    (signature, index) of the position in the tables, or None when it has too many pieces, castling rights or an
+    en passant capture. Ignores whether any of that table exists
+    """
+    bitboards = gs.bitboards
+    letters, squares = {}, {}
+    count = 0
+    for color in "wb":
+        colorLetters, colorSquares = "", [bitboards[color + "K"].bit_length() - 1]
+        for letter in PIECE_ORDER:
+            pieces = bitboards[color + letter]
+            while pieces:
+                lsb = pieces & -pieces
+                colorLetters += letter
+                colorSquares.append(lsb.bit_length() - 1)
+                pieces ^= lsb
+        count += len(colorSquares)
+        letters[color], squares[color] = colorLetters, colorSquares
+    if count > MAX_PIECES:
+        return None
+    if gs.enpassantPossible and not ignoreEnpassant:
+        epSq = gs.enpassantPossible[0] * 8 + gs.enpassantPossible[1]
+        mover, other = ("w", "b") if gs.whiteToMove else ("b", "w")
+        if ChessEngine.PAWN_ATTACKS[other][epSq] & bitboards[mover + "P"]:
+            return None  # the tables don't know this en passant capture
+    if gs.castlingRights:
+        return None
+    whiteToMove = gs.whiteToMove
+    if sideStrength(letters["b"]) > sideStrength(letters["w"]):  # swap colours so the stronger side is white
+        signature = "K" + letters["b"] + "vK" + letters["w"]
+        ordered = [sq ^ 56 for sq in squares["b"] + squares["w"]]
+        whiteToMove = not whiteToMove
+    else:
+        signature = "K" + letters["w"] + "vK" + letters["b"]
+        ordered = squares["w"] + squares["b"]
+    if signature in TRIVIAL_DRAWS:
+        return signature, 0
+    return signature, layoutFor(signature).index(whiteToMove, ordered)
+
+
+_layouts = {}
+
+
+def layoutFor(signature) -> TableLayout:
+    if signature not in _layouts:
+        _layouts[signature] = TableLayout(signature)
+    return _layouts[signature]
+
+
+def decodeValue(value):
+    """
+    (WIN_RESULT/DRAW_RESULT/LOSS_RESULT, plies) for a stored byte, from the side to move's point of view
+    """
+    if value == DRAW:
+        return DRAW_RESULT, 0
+    if value < LOSS:
+        return WIN_RESULT, value
+    return LOSS_RESULT, value - LOSS
+
+
+class Tablebase:
+    """
+    The tables in a directory, memory-mapped as they are first needed
+    """
+
+    def __init__(self, directory=TABLEBASE_DIR):
+        self.directory = directory
+        self.tables = {}
+        self.files = []
+        self.available = set(TRIVIAL_DRAWS)
+        if os.path.isdir(directory):
+            for name in os.listdir(directory):
+                if name.endswith(".tb"):
+                    self.available.add(name[:-3])
+        self.maxPieces = max(len(signature) - 1 for signature in self.available)  # letters minus the "v"
+
+    def table(self, signature):
+        if signature not in self.tables:
+            tableFile = open(os.path.join(self.directory, signature + ".tb"), "rb")
+            data = mmap.mmap(tableFile.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, storedSignature = HEADER.unpack_from(data, 0)
+            if magic != MAGIC or storedSignature.rstrip(b"\0").decode() != signature:
+                raise ValueError(f"{signature}.tb is not a tablebase for {signature}")
+            self.files.append(tableFile)
+            self.tables[signature] = data
+        return self.tables[signature]
+
+    def probeKey(self, key):
+        if key is None or key[0] not in self.available:
+            return None
+        signature, index = key
+        if signature in TRIVIAL_DRAWS:
+            return DRAW_RESULT, 0
+        return decodeValue(self.table(signature)[HEADER.size + index])
+
+    def probe(self, gs):
+        """
+        (WIN_RESULT/DRAW_RESULT/LOSS_RESULT, plies to mate) for the side to move, or None when the position isn't
+        covered by the tables present
+        """
+        return self.probeKey(positionKey(gs))
+
+    def close(self) -> None:
+        for data in self.tables.values():
+            data.close()
+        for tableFile in self.files:
+            tableFile.close()
+        self.tables, self.files = {}, []
+
+
+"""
+Signatures a table converts into by a capture or a promotion, which have to exist before it can be generated
+"""
+
+
+def dependencies(signature) -> set:
+    whiteLetters, blackLetters = signature[1:].split("vK")
+    result = set()
+    for mover, opponent, moverIsWhite in ((whiteLetters, blackLetters, True), (blackLetters, whiteLetters, False)):
+        moverVariants = {mover}
+        if "P" in mover:
+            pawn = mover.index("P")
+            moverVariants |= {mover[:pawn] + promoted + mover[pawn + 1:] for promoted in "QRBN"}
+        opponentVariants = {opponent} | {opponent[:i] + opponent[i + 1:] for i in range(len(opponent))}
+        for moverVariant in moverVariants:
+            for opponentVariant in opponentVariants:
+                if moverIsWhite:
+                    result.add(canonicalSignature(moverVariant, opponentVariant))
+                else:
+                    result.add(canonicalSignature(opponentVariant, moverVariant))
+    result.discard(signature)
+    return result
+
+
+def generate(signature, directory=TABLEBASE_DIR, log=print) -> None:
+    """
+    Retrograde analysis of one ending. Every legal position has its moves generated once; moves that stay in the
+    ending become edges, captures and promotions are scored from the smaller tables. Then, starting from the
+    checkmates, results are spread backwards ply by ply: a position is a win once one move reaches a lost position,
+    and lost once every move reaches a won one. Whatever is left unresolved is a draw
+    """
+    if hasEnpassant(signature):
+        raise ValueError(f"{signature} has pawns on both sides, the generator can't score en passant captures")
+    layout = layoutFor(signature)
+    tablebase = Tablebase(directory)
+    missing = dependencies(signature) - tablebase.available
+    if missing:
+        raise ValueError(f"generate {', '.join(sorted(missing))} before {signature}")
+    start = time.perf_counter()
+    size = layout.size
+    values = bytearray([ILLEGAL]) * size
+    resolved = bytearray(size)
+    edgeStarts = array("i", [0]) * (size + 1)
+    edges = array("i")
+    remaining = array("h", [0]) * size  # moves that stay in the table not yet known to lose for the mover
+    longestLoss = bytearray(size)  # most plies of the opponent's wins seen among the moves
+    cannotLose = bytearray(size)  # some move draws or wins, whatever the rest do
+    winBuckets = [[] for _ in range(256)]
+    lossBuckets = [[] for _ in range(256)]
+    gs = ChessEngine.GameState()
+    blackKing = layout.pieces.index("bK")
+
+    for index in range(size):
+        edgeStarts[index] = len(edges)
+        whiteToMove, squares = layout.decode(index)
+        if len(set(squares)) < len(squares) or ChessEngine.KING_ATTACKS[squares[0]] >> squares[blackKing] & 1:
+            continue
+        board = [["--"] * 8 for _ in range(8)]
+        onBackRank = False
+        for piece, sq in zip(layout.pieces, squares):
+            if piece[1] == "P" and (sq < 8 or sq >= 56):
+                onBackRank = True
+            board[sq >> 3][sq & 7] = piece
+        if onBackRank:
+            continue
+        gs.setPosition(board, whiteToMove, 0, ())
+        opponentKing = gs.blackKingLocation if whiteToMove else gs.whiteKingLocation
+        if gs.isSquareAttacked(opponentKing[0] * 8 + opponentKing[1], "w" if whiteToMove else "b"):
+            continue  # the side that just moved is still in check
+        moves = gs.getLegalMoves()
+        values[index] = DRAW
+        if not moves:
+            if gs.checkmate:
+                lossBuckets[0].append(index)
+            else:
+                resolved[index] = 1  # stalemate
+            continue
+        bestExit = None
+        for move in moves:
+            gs.makeMoveCode(move)
+            # only one side has pawns (see hasEnpassant), so no reply is en passant
+            childSignature, childIndex = positionKey(gs, ignoreEnpassant=True)
+            gs.undoMove()
+            if childSignature == signature:
+                edges.append(childIndex)
+                continue
+            result, plies = tablebase.probeKey((childSignature, childIndex))
+            if result == LOSS_RESULT:
+                bestExit = plies + 1 if bestExit is None else min(bestExit, plies + 1)
+                cannotLose[index] = 1
+            elif result == DRAW_RESULT:
+                cannotLose[index] = 1
+            else:
+                longestLoss[index] = max(longestLoss[index], plies)
+        remaining[index] = len(edges) - edgeStarts[index]
+        if bestExit is not None:
+            winBuckets[bestExit].append(index)
+        elif remaining[index] == 0 and not cannotLose[index]:
+            lossBuckets[longestLoss[index] + 1].append(index)
+    edgeStarts[size] = len(edges)
+    tablebase.close()
+    log(f"{signature}: {size} positions, {len(edges)} moves inside the table, "
+        f"{time.perf_counter() - start:.1f}s")
+
+    # parents of every position, the edges turned around
+    parentStarts = array("i", [0]) * (size + 1)
+    for child in edges:
+        parentStarts[child + 1] += 1
+    for index in range(size):
+        parentStarts[index + 1] += parentStarts[index]
+    parents = array("i", [0]) * len(edges)
+    fill = array("i", parentStarts)
+    for index in range(size):
+        for edge in range(edgeStarts[index], edgeStarts[index + 1]):
+            child = edges[edge]
+            parents[fill[child]] = index
+            fill[child] += 1
+    del edges, fill
+
+    for plies in range(256):
+        if plies >= ILLEGAL - LOSS and (lossBuckets[plies] or winBuckets[plies]):
+            raise ValueError(f"{signature} has mates longer than the format can store")
+        if plies % 2 == 0:
+            for index in lossBuckets[plies]:
+                if resolved[index]:
+                    continue
+                resolved[index] = 1
+                values[index] = LOSS + plies
+                for edge in range(parentStarts[index], parentStarts[index + 1]):
+                    parent = parents[edge]
+                    if not resolved[parent]:
+                        winBuckets[plies + 1].append(parent)
+        else:
+            for index in winBuckets[plies]:
+                if resolved[index]:
+                    continue
+                resolved[index] = 1
+                values[index] = plies
+                for edge in range(parentStarts[index], parentStarts[index + 1]):
+                    parent = parents[edge]
+                    if resolved[parent]:
+                        continue
+                    remaining[parent] -= 1
+                    if plies > longestLoss[parent]:
+                        longestLoss[parent] = plies
+                    if remaining[parent] == 0 and not cannotLose[parent]:
+                        lossBuckets[longestLoss[parent] + 1].append(parent)
+
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, signature + ".tb"), "wb") as tableFile:
+        tableFile.write(HEADER.pack(MAGIC, signature.encode()))
+        tableFile.write(values)
+    wins = sum(1 for value in values if 0 < value < LOSS)
+    losses = sum(1 for value in values if LOSS <= value < ILLEGAL)
+    log(f"{signature}: {wins} wins, {losses} losses for the side to move, longest mate "
+        f"{max((value for value in values if value < LOSS), default=0)} plies, {time.perf_counter() - start:.1f}s")
+
+
+"""
+Every signature with up to pieces pieces, in an order where each one comes after the ones it converts into
+"""
+
+
+def allSignatures(pieces) -> list[str]:
+    signatures = set()
+    for count in range(0, pieces - 1):
+        for letters in itertools.combinations_with_replacement(PIECE_ORDER, count):
+            for split in range(count + 1):
+                for white in itertools.combinations(letters, split):
+                    black = list(letters)
+                    for letter in white:
+                        black.remove(letter)
+                    signatures.add(canonicalSignature("".join(white), "".join(black)))
+    return sorted((signature for signature in signatures - TRIVIAL_DRAWS if not hasEnpassant(signature)),
+                  key=lambda signature: (len(signature), signature))
+
+
+def generateWithDependencies(signatures, directory=TABLEBASE_DIR, log=print) -> None:
+    done = Tablebase(directory).available
+
+    def visit(signature):
+        if signature in done:
+            return
+        for dependency in sorted(dependencies(signature)):
+            visit(dependency)
+        generate(signature, directory, log)
+        done.add(signature)
+
+    for signature in signatures:
+        visit(signature)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Generate or probe endgame tablebases for ChessAI")
+    parser.add_argument("signature", nargs="*", help="endings to generate, e.g. KRvK or KQvKR")
+    parser.add_argument("--all", type=int, choices=(3, 4), help="generate every ending with up to this many pieces")
+    parser.add_argument("-d", "--directory", default=TABLEBASE_DIR, help="where the tables are kept")
+    parser.add_argument("--probe", metavar="FEN", help="print the result of a position")
+    args = parser.parse_args(argv)
+
+    if args.probe:
+        gs = ChessEngine.GameState.from_fen(args.probe)
+        result = Tablebase(args.directory).probe(gs)
+        if result is None:
+            print("not in the tablebases")
+        else:
+            outcome, plies = result
+            side = "white" if gs.whiteToMove else "black"
+            print("draw" if outcome == DRAW_RESULT else
+                  f"{side} {'mates' if outcome == WIN_RESULT else 'is mated'} in {plies} plies")
+        return 0
+
+    signatures = list(args.signature)
+    if args.all:
+        signatures += allSignatures(args.all)
+    if not signatures:
+        parser.error("name the endings to generate or use --all")
+    for signature in signatures:
+        whiteLetters, _, blackLetters = signature.partition("vK")
+        if (not signature.startswith("K") or "vK" not in signature or len(signature) - 1 > MAX_PIECES or
+                canonicalSignature(whiteLetters[1:], blackLetters) != signature):
+            parser.error(f"{signature} is not a canonical signature of up to {MAX_PIECES} pieces "
+                         f"(stronger side first, pieces in {PIECE_ORDER} order)")
+        if hasEnpassant(signature):
+            parser.error(f"{signature} has pawns on both sides, which the generator doesn't support yet")
+    generateWithDependencies(signatures, args.directory)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
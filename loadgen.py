@@ -0,0 +1,122 @@
+# Load generator for server.py: opens many sessions at once, each playing random legal moves against the engine,
+# and reports the latency of the move requests the engine answered (its search included) as p50/p99. Requests the
+# server turned down (busy, timed out) are counted as errors instead.
+#
+#   python server.py &
+#   python loadgen.py                           50 sessions, 10 moves each
+#   python loadgen.py -c 200 -m 20 --time-ms 100
+#   python loadgen.py --json                    summary as one JSON line
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import sys
+import time
+
+import server
+
+DEFAULT_CLIENTS = 50
+DEFAULT_MOVES = 10
+
+"""
+The value below which p percent of the sorted values fall (nearest rank)
+"""
+
+
+def percentile(values, p) -> float:
+    if not values:
+        return 0.0
+    return values[min(max(math.ceil(p / 100 * len(values)) - 1, 0), len(values) - 1)]
+
+
+class Client:
+    """
+    One session against the server, counting the latency of its requests and the errors it got back
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.latencies = []
+        self.errors = {}
+
+    async def request(self, request) -> dict:
+        start = time.perf_counter()
+        self.writer.write(json.dumps(request).encode() + b"\n")
+        await self.writer.drain()
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionError("the server closed the connection")
+        response = json.loads(line)
+        if request["cmd"] == "move" and response["ok"]:
+            self.latencies.append(time.perf_counter() - start)
+        if not response["ok"]:
+            self.errors[response["error"]] = self.errors.get(response["error"], 0) + 1
+        return response
+
+
+async def playSession(host, port, moves, time_ms, seed) -> Client:
+    rng = random.Random(seed)
+    reader, writer = await asyncio.open_connection(host, port)
+    client = Client(reader, writer)
+    newGame = {"cmd": "new", "timeMs": time_ms}
+    try:
+        state = await client.request(newGame)
+        for _ in range(moves):
+            if state["result"] is not None:
+                state = await client.request(newGame)
+            reply = await client.request({"cmd": "move", "move": rng.choice(state["legal"])})
+            # after an error (busy, timed out) the engine hasn't answered our move, start over rather than wait
+            state = reply if reply["ok"] else await client.request(newGame)
+    finally:
+        writer.write(b'{"cmd": "quit"}\n')
+        writer.close()
+    return client
+
+
+async def run(host, port, clients, moves, time_ms, seed):
+    start = time.perf_counter()
+    results = await asyncio.gather(*(playSession(host, port, moves, time_ms, seed + i) for i in range(clients)),
+                                   return_exceptions=True)
+    elapsed = time.perf_counter() - start
+    latencies = sorted(latency for result in results if isinstance(result, Client) for latency in result.latencies)
+    errors = {}
+    for result in results:
+        if isinstance(result, Client):
+            for error, count in result.errors.items():
+                errors[error] = errors.get(error, 0) + count
+        else:
+            errors[type(result).__name__] = errors.get(type(result).__name__, 0) + 1
+    return {"clients": clients, "moves": len(latencies), "seconds": round(elapsed, 2),
+            "movesPerSecond": round(len(latencies) / elapsed, 1) if elapsed > 0 else 0.0,
+            "p50Ms": round(1000 * percentile(latencies, 50), 1), "p99Ms": round(1000 * percentile(latencies, 99), 1),
+            "maxMs": round(1000 * latencies[-1], 1) if latencies else 0.0, "errors": errors}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Load generator for the ChessAI game server")
+    parser.add_argument("--host", default=server.DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=server.DEFAULT_PORT)
+    parser.add_argument("-c", "--clients", type=int, default=DEFAULT_CLIENTS, help="sessions played at once")
+    parser.add_argument("-m", "--moves", type=int, default=DEFAULT_MOVES, help="moves each session plays")
+    parser.add_argument("--time-ms", type=int, default=server.DEFAULT_TIME_MS, help="engine time limit per move")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first session, the rest count up")
+    parser.add_argument("--json", action="store_true", help="print the summary as one JSON line")
+    args = parser.parse_args(argv)
+
+    summary = asyncio.run(run(args.host, args.port, args.clients, args.moves, args.time_ms, args.seed))
+    if args.json:
+        print(json.dumps(summary))
+    else:
+        print(f"{summary['clients']} sessions, {summary['moves']} moves in {summary['seconds']}s "
+              f"({summary['movesPerSecond']}/s)")
+        print(f"latency p50 {summary['p50Ms']}ms  p99 {summary['p99Ms']}ms  max {summary['maxMs']}ms")
+        for error, count in sorted(summary["errors"].items()):
+            print(f"{count} x {error}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,7 +3,7 @@
 import asyncio
 import ChessAI
 import ChessEngine
-from multiprocessing import Process, Queue, freeze_support
+from multiprocessing import freeze_support
 import pygame as p
 
 BOARD_WIDTH = BOARD_HEIGHT = 512  # 400 also works
@@ -26,7 +26,7 @@ async def main():
     playerOne = True  # if a Human is playing white, then true. If AI is playing, then false
     playerTwo = True  # Same as above but for black
     AIThinking = False
-    moveFinderProcess = None
+    searchWorker = ChessAI.SearchWorker()  # one process for the whole game, keeps its hash table between moves
 
     running = True
     while running:
@@ -40,18 +40,16 @@ async def main():
                                                                                  isHumanTurn)
             elif e.type == p.KEYDOWN:
                 gs, validMoves, sqSelected, playerClicks, moveMade, animate, gameOver, AIThinking, moveUndone = handle_key_press(
-                    e, gs, validMoves, sqSelected, playerClicks, gameOver, AIThinking, moveFinderProcess, moveUndone)
+                    e, gs, validMoves, sqSelected, playerClicks, gameOver, AIThinking, searchWorker, moveUndone)
 
         # AI move finder logic
         if not gameOver and not isHumanTurn and not moveUndone:
             if not AIThinking:
                 AIThinking = True
-                returnQueue = Queue()  # used to pass data between threads
-                moveFinderProcess = Process(target=ChessAI.findBestMove, args=(gs, validMoves, returnQueue))
-                moveFinderProcess.start()  # calls ChessAI.findBestMove(gs, validMoves, returnQueue)
+                searchWorker.search(gs, validMoves)  # sends the worker the moves played since its last search
 
-            if not moveFinderProcess.is_alive():
-                AIMove = returnQueue.get()
+            if searchWorker.poll():
+                AIMove = searchWorker.bestMove
                 if AIMove is None:
                     AIMove = ChessAI.findRandomMove(validMoves)
                 gs.makeMove(AIMove)
@@ -69,13 +67,14 @@ async def main():
 
         drawGameState(screen, gs, validMoves, gs.moveLog, sqSelected, moveLogFont)
 
-        if gs.checkmate or gs.stalemate:
+        if gs.checkmate or gs.stalemate or gs.threefoldRepetition or gs.fiftyMoveRule:
             gameOver = True
             game_over_text(gs, screen)
 
         clock.tick(MAX_FPS)
         p.display.flip()
         await asyncio.sleep(0)
+    searchWorker.close()
 
 
 """
@@ -204,7 +203,7 @@ Handles keyboard inputs
 """
 
 
-def handle_key_press(e, gs, validMoves, sqSelected, playerClicks, gameOver, AIThinking, moveFinderProcess, moveUndone):
+def handle_key_press(e, gs, validMoves, sqSelected, playerClicks, gameOver, AIThinking, searchWorker, moveUndone):
     moveMade = False
     animate = False
     if e.key == p.K_LEFT:  # undo move
@@ -213,7 +212,7 @@ def handle_key_press(e, gs, validMoves, sqSelected, playerClicks, gameOver, AITh
         animate = False
         gameOver = False
         if AIThinking:
-            moveFinderProcess.terminate()
+            searchWorker.cancel()
             AIThinking = False
         moveUndone = True
     elif e.key == p.K_r:  # reset board when r is pressed
@@ -225,7 +224,7 @@ def handle_key_press(e, gs, validMoves, sqSelected, playerClicks, gameOver, AITh
         animate = False
         gameOver = False
         if AIThinking:
-            moveFinderProcess.terminate()
+            searchWorker.cancel()
             AIThinking = False
         moveUndone = True
     return gs, validMoves, sqSelected, playerClicks, moveMade, animate, gameOver, AIThinking, moveUndone
@@ -242,6 +241,10 @@ def game_over_text(gs, screen):
         drawEndGameText(screen, f"{winner} wins by checkmate")
     elif gs.stalemate:
         drawEndGameText(screen, "Stalemate")
+    elif gs.threefoldRepetition:
+        drawEndGameText(screen, "Draw by threefold repetition")
+    elif gs.fiftyMoveRule:
+        drawEndGameText(screen, "Draw by the fifty-move rule")
 
 
 """
@@ -0,0 +1,123 @@
+# Perft benchmark and correctness suite for ChessEngine.
+# Counts the leaf nodes of the legal move tree for well known positions, compares them with the published
+# numbers and reports nodes/sec. Exits with status 1 when any count is wrong.
+#
+#   python perft.py                      every position up to depth 3
+#   python perft.py -d 5 -p kiwipete     one position, deeper
+#   python perft.py -p start --divide 3  nodes per root move, for tracking down a wrong count
+#   python perft.py --json               one JSON line per position, for comparing releases
+
+import argparse
+import json
+import sys
+import time
+
+import ChessEngine
+
+# name: (FEN, [nodes at depth 1, depth 2, ...])
+POSITIONS = {
+    "start": ("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+              [20, 400, 8902, 197281, 4865609]),
+    "kiwipete": ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+                 [48, 2039, 97862, 4085603]),
+    "position3": ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+                  [14, 191, 2812, 43238, 674624]),
+    "position4": ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+                  [6, 264, 9467, 422333]),
+    "position5": ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+                  [44, 1486, 62379, 2103487]),
+    "position6": ("r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+                  [46, 2079, 89890, 3894594]),
+    # en passant edge cases
+    "illegal-ep-1": ("3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1",
+                     [18, 92, 1670, 10138, 185429, 1134888]),
+    "illegal-ep-2": ("8/8/4k3/8/2p5/8/B2P2K1/8 w - - 0 1",
+                     [13, 102, 1266, 10276, 135655, 1015133]),
+    "ep-gives-check": ("8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1",
+                       [15, 126, 1928, 13931, 206379, 1440467]),
+    # castling edge cases
+    "short-castle-check": ("5k2/8/8/8/8/8/8/4K2R w K - 0 1",
+                           [15, 66, 1198, 6399, 120330, 661072]),
+    "long-castle-check": ("3k4/8/8/8/8/8/8/R3K3 w Q - 0 1",
+                          [16, 71, 1286, 7418, 141077, 803711]),
+    "castle-rights": ("r3k2r/1b4bq/8/8/8/8/7B/R3K2R w KQkq - 0 1",
+                      [26, 1141, 27826, 1274206]),
+    "castle-prevented": ("r3k2r/8/3Q4/8/8/5q2/8/R3K2R b KQkq - 0 1",
+                         [44, 1494, 50509, 1720476]),
+    # promotion edge cases
+    "promote-out-of-check": ("2K2r2/4P3/8/8/8/8/8/3k4 w - - 0 1",
+                             [11, 133, 1442, 19174, 266199, 3821001]),
+    "discovered-check": ("8/8/1P2K3/8/2n5/1q6/8/5k2 b - - 0 1",
+                         [29, 165, 5160, 31961, 1004658]),
+    "promote-to-check": ("4k3/1P6/8/8/8/8/K7/8 w - - 0 1",
+                         [9, 40, 472, 2661, 38983, 217342]),
+    "underpromote-to-check": ("8/P1k5/K7/8/8/8/8/8 w - - 0 1",
+                              [6, 27, 273, 1329, 18135, 92683]),
+    # stalemate and checkmate
+    "self-stalemate": ("K1k5/8/P7/8/8/8/8/8 w - - 0 1",
+                       [2, 6, 13, 63, 382, 2217]),
+    "stalemate-checkmate-1": ("8/k1P5/8/1K6/8/8/8/8 w - - 0 1",
+                              [10, 25, 268, 926, 10857, 43261, 567584]),
+    "stalemate-checkmate-2": ("8/8/2k5/5q2/5n2/8/5K2/8 b - - 0 1",
+                              [37, 183, 6559, 23527]),
+}
+
+DEFAULT_DEPTH = 3
+
+"""
+Runs perft at every depth up to maxDepth that has a published count. Returns a result dict per depth
+"""
+
+
+def runPosition(name, maxDepth) -> list[dict]:
+    fen, expectedCounts = POSITIONS[name]
+    results = []
+    for depth in range(1, min(maxDepth, len(expectedCounts)) + 1):
+        gs = ChessEngine.GameState.from_fen(fen)
+        start = time.perf_counter()
+        nodes = gs.perft(depth)
+        elapsed = time.perf_counter() - start
+        results.append({"position": name, "depth": depth, "nodes": nodes, "expected": expectedCounts[depth - 1],
+                        "seconds": round(elapsed, 4), "nps": int(nodes / elapsed) if elapsed > 0 else 0,
+                        "ok": nodes == expectedCounts[depth - 1]})
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Perft correctness and speed benchmark for ChessEngine")
+    parser.add_argument("-d", "--depth", type=int, default=DEFAULT_DEPTH, help="deepest depth to run")
+    parser.add_argument("-p", "--position", action="append", choices=sorted(POSITIONS),
+                        help="position to run (repeatable, default all)")
+    parser.add_argument("--divide", type=int, metavar="DEPTH", help="print nodes per root move instead")
+    parser.add_argument("--json", action="store_true", help="print one JSON line per result")
+    args = parser.parse_args(argv)
+    names = args.position or list(POSITIONS)
+
+    if args.divide:
+        for name in names:
+            counts = ChessEngine.GameState.from_fen(POSITIONS[name][0]).divide(args.divide)
+            for notation, nodes in sorted(counts.items()):
+                print(f"{notation}: {nodes}")
+            print(f"\n{name}: {len(counts)} moves, {sum(counts.values())} nodes")
+        return 0
+
+    failed = 0
+    totalNodes, totalSeconds = 0, 0.0
+    for name in names:
+        for result in runPosition(name, args.depth):
+            totalNodes += result["nodes"]
+            totalSeconds += result["seconds"]
+            failed += not result["ok"]
+            if args.json:
+                print(json.dumps(result))
+            else:
+                print(f"{name:24} depth {result['depth']}  nodes {result['nodes']:>9}  expected {result['expected']:>9}"
+                      f"  {result['seconds']:8.3f}s  {result['nps']:>8} nps  {'OK' if result['ok'] else 'MISMATCH'}")
+    if not args.json:
+        print(f"\ntotal {totalNodes} nodes in {totalSeconds:.2f}s, {int(totalNodes / max(totalSeconds, 1e-9))} nps, "
+              f"{failed} mismatches")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
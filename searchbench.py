@@ -0,0 +1,84 @@
+# Parallel search benchmark for ChessAI.
+# Searches a few positions to a fixed depth with one process and then with a Lazy SMP search over N processes,
+# each run with a fresh transposition table, and reports the time-to-depth speedup and nodes/sec.
+#
+#   python searchbench.py                  depth 4, one process against every core
+#   python searchbench.py -d 5 -w 2 -w 4   compare 1, 2 and 4 processes
+#   python searchbench.py --json           one JSON line per run
+#   python searchbench.py -w 1 --no-pvs --no-aspiration
+#                                          nodes of plain alpha-beta, to compare with the default's
+#
+# Every run deepens one ply at a time up to the depth, like a timed search does: a Lazy SMP search always does, so
+# the single process has to as well for the times to compare.
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+
+import ChessAI
+import ChessEngine
+import perft
+
+DEFAULT_POSITIONS = ["start", "kiwipete", "position4", "position6"]
+DEFAULT_DEPTH = 4
+
+"""
+Searches one position to depth with the given number of processes. Returns a result dict
+"""
+
+
+def runSearch(name, depth, workers, pvs=ChessAI.USE_PVS, aspiration=ChessAI.USE_ASPIRATION) -> dict:
+    gs = ChessEngine.GameState.from_fen(perft.POSITIONS[name][0])
+    validMoves = gs.getValidMoves()
+    searcher = ChessAI.Searcher(ChessAI.TranspositionTable(), workers, useBook=False, verbose=False, pvs=pvs,
+                                aspiration=aspiration)
+    start = time.perf_counter()
+    stats = searcher.search(gs, validMoves, math.inf, depth)
+    elapsed = time.perf_counter() - start
+    return {"position": name, "depth": depth, "workers": workers, "pvs": pvs, "aspiration": aspiration,
+            "move": str(searcher.bestMove), "score": stats.score, "seconds": round(elapsed, 4), "nodes": stats.nodes,
+            "helperNodes": stats.helperNodes,
+            "nps": int((stats.nodes + stats.helperNodes) / elapsed) if elapsed > 0 else 0,
+            "seldepth": stats.seldepth, "firstMoveCutoffRate": round(stats.firstMoveCutoffRate, 4),
+            "ttHitRate": round(stats.ttHitRate, 4), "pvsResearches": stats.pvsResearches,
+            "aspirationResearches": stats.aspirationResearches}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Lazy SMP speedup benchmark for ChessAI")
+    parser.add_argument("-d", "--depth", type=int, default=DEFAULT_DEPTH, help="depth every search goes to")
+    parser.add_argument("-w", "--workers", type=int, action="append",
+                        help="process count to compare with 1 (repeatable, default every core)")
+    parser.add_argument("-p", "--position", action="append", choices=sorted(perft.POSITIONS),
+                        help="position to search (repeatable, default a few middlegames)")
+    parser.add_argument("--no-pvs", action="store_true", help="search every move with the full alpha-beta window")
+    parser.add_argument("--no-aspiration", action="store_true",
+                        help="start every iteration with the full window")
+    parser.add_argument("--json", action="store_true", help="print one JSON line per run")
+    args = parser.parse_args(argv)
+    names = args.position or DEFAULT_POSITIONS
+    workerCounts = [1] + [w for w in (args.workers or [os.cpu_count() or 1]) if w > 1]
+
+    totals = {workers: 0.0 for workers in workerCounts}
+    for name in names:
+        for workers in workerCounts:
+            result = runSearch(name, args.depth, workers, not args.no_pvs, not args.no_aspiration)
+            totals[workers] += result["seconds"]
+            if args.json:
+                print(json.dumps(result))
+            else:
+                print(f"{name:12} depth {args.depth}  {workers:>2} processes  {result['seconds']:8.3f}s  "
+                      f"{result['nodes'] + result['helperNodes']:>9} nodes  {result['nps']:>8} nps  {result['move']}")
+    if not args.json:
+        print()
+        for workers in workerCounts:
+            print(f"{workers:>2} processes: {totals[workers]:8.3f}s total, speedup "
+                  f"{totals[1] / max(totals[workers], 1e-9):.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
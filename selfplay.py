@@ -0,0 +1,200 @@
+# Headless engine-vs-engine matches for ChessAI.
+# Plays games between two strategies across a process pool, without pygame, and reports win/draw/loss for the
+# first one together with the nodes/sec of each. Games alternate colours and open with a few random plies so
+# deterministic strategies don't replay the same game.
+#
+#   python selfplay.py alphabeta:3 greedy -n 100            100 games on every core
+#   python selfplay.py time:200 alphabeta:2 -o match.pgn    save the games as PGN
+#   python selfplay.py random random -n 1000 --json         summary as one JSON line
+#
+# Strategies: random, greedy, alphabeta:DEPTH (findBestMove to a fixed depth), time:MS (findBestMove with a budget)
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import time
+from multiprocessing import Pool
+
+import ChessAI
+import ChessEngine
+
+DEFAULT_GAMES = 10
+DEFAULT_MAX_PLIES = 1000  # safety net, repetitions and the fifty-move rule end games long before this
+DEFAULT_RANDOM_PLIES = 4
+
+"""
+Checks a strategy name, so a typo fails before any game is started
+"""
+
+
+def parseStrategy(spec) -> str:
+    name, _, argument = spec.partition(":")
+    if name in ("random", "greedy") and not argument:
+        return spec
+    if name in ("alphabeta", "time") and argument.isdigit() and int(argument) > 0:
+        return spec
+    raise argparse.ArgumentTypeError(f"unknown strategy {spec!r}")
+
+
+class Player:
+    """
+    One side of a game: picks moves with its strategy and counts the search nodes and time that took
+    """
+
+    def __init__(self, spec, useBook=True):
+        self.spec = spec
+        self.name, _, argument = spec.partition(":")
+        self.argument = int(argument) if argument else None
+        self.searcher = None
+        if self.name in ("alphabeta", "time"):
+            self.searcher = ChessAI.Searcher(ChessAI.TranspositionTable(), useBook=useBook)
+        self.nodes = 0
+        self.seconds = 0.0
+
+    def chooseMove(self, gs, validMoves):
+        start = time.perf_counter()
+        if self.name == "random":
+            move = ChessAI.findRandomMove(validMoves)
+        elif self.name == "greedy":
+            move = ChessAI.findGreedyMove(gs, validMoves)
+        else:
+            with contextlib.redirect_stdout(io.StringIO()):  # the search prints its stats
+                if self.name == "alphabeta":
+                    stats = self.searcher.search(gs, validMoves, max_depth=self.argument)
+                else:
+                    stats = self.searcher.search(gs, validMoves, time_ms=self.argument, max_depth=ChessAI.MAX_PLY)
+            move = self.searcher.bestMove
+            self.nodes += stats.nodes
+        self.seconds += time.perf_counter() - start
+        return move if move is not None else ChessAI.findRandomMove(validMoves)
+
+
+"""
+Plays one game. Runs in a pool process, so it takes and returns plain data
+"""
+
+
+def playGame(job) -> dict:
+    index, whiteSpec, blackSpec, maxPlies, randomPlies, useBook, seed = job
+    random.seed(seed)
+    players = {True: Player(whiteSpec, useBook), False: Player(blackSpec, useBook)}
+    gs = ChessEngine.GameState()
+    validMoves = gs.getValidMoves()
+    sanMoves = []
+    while (not (gs.checkmate or gs.stalemate or gs.threefoldRepetition or gs.fiftyMoveRule) and
+           len(sanMoves) < maxPlies):
+        if len(sanMoves) < randomPlies:
+            move = ChessAI.findRandomMove(validMoves)
+        else:
+            move = players[gs.whiteToMove].chooseMove(gs, validMoves)
+        sanMoves.append(gs.sanNotation(move, validMoves))
+        gs.makeMove(move)
+        validMoves = gs.getValidMoves()
+
+    if gs.checkmate:
+        result, termination = ("0-1" if gs.whiteToMove else "1-0"), "checkmate"
+    elif gs.stalemate:
+        result, termination = "1/2-1/2", "stalemate"
+    elif gs.threefoldRepetition:
+        result, termination = "1/2-1/2", "threefold repetition"
+    elif gs.fiftyMoveRule:
+        result, termination = "1/2-1/2", "fifty-move rule"
+    else:
+        result, termination = "1/2-1/2", "move limit"
+    return {"index": index, "white": whiteSpec, "black": blackSpec, "result": result, "termination": termination,
+            "moves": sanMoves,
+            "nodes": {"white": players[True].nodes, "black": players[False].nodes},
+            "seconds": {"white": players[True].seconds, "black": players[False].seconds}}
+
+
+def gamePgn(game) -> str:
+    tags = [("Event", "ChessAI self-play"), ("Site", "?"), ("Date", time.strftime("%Y.%m.%d")),
+            ("Round", str(game["index"] + 1)), ("White", game["white"]), ("Black", game["black"]),
+            ("Result", game["result"]), ("Termination", game["termination"])]
+    lines = [f'[{tag} "{value}"]' for tag, value in tags]
+    movetext = []
+    for ply, san in enumerate(game["moves"]):
+        movetext.append(f"{ply // 2 + 1}. {san}" if ply % 2 == 0 else san)
+    movetext.append(game["result"])
+    # PGN wants movetext lines under 80 characters
+    line = ""
+    body = []
+    for token in movetext:
+        if line and len(line) + 1 + len(token) > 79:
+            body.append(line)
+            line = token
+        else:
+            line = f"{line} {token}" if line else token
+    body.append(line)
+    return "\n".join(lines) + "\n\n" + "\n".join(body) + "\n"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Headless engine-vs-engine matches for ChessAI")
+    parser.add_argument("engine", type=parseStrategy, help="first strategy, stats are from its side")
+    parser.add_argument("opponent", type=parseStrategy, help="second strategy")
+    parser.add_argument("-n", "--games", type=int, default=DEFAULT_GAMES, help="games to play")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="pool processes")
+    parser.add_argument("--max-plies", type=int, default=DEFAULT_MAX_PLIES, help="plies before a game is drawn")
+    parser.add_argument("--random-plies", type=int, default=DEFAULT_RANDOM_PLIES,
+                        help="random opening plies before the strategies take over")
+    parser.add_argument("--no-book", action="store_true", help="search every move, even in the opening book")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first game, the rest count up")
+    parser.add_argument("-o", "--pgn", help="write the games to this PGN file")
+    parser.add_argument("--json", action="store_true", help="print the summary as one JSON line")
+    args = parser.parse_args(argv)
+
+    jobs = []
+    for index in range(args.games):
+        white, black = (args.engine, args.opponent) if index % 2 == 0 else (args.opponent, args.engine)
+        jobs.append((index, white, black, args.max_plies, args.random_plies, not args.no_book, args.seed + index))
+
+    wins = draws = losses = 0
+    nodes = {args.engine: 0, args.opponent: 0} if args.engine != args.opponent else {args.engine: 0}
+    seconds = dict.fromkeys(nodes, 0.0)
+    games = []
+    start = time.perf_counter()
+    with Pool(args.jobs) as pool:
+        for game in pool.imap_unordered(playGame, jobs):
+            games.append(game)
+            engineIsWhite = game["index"] % 2 == 0  # colours alternate, see jobs above
+            if game["result"] == "1/2-1/2":
+                draws += 1
+            elif (game["result"] == "1-0") == engineIsWhite:
+                wins += 1
+            else:
+                losses += 1
+            for side in ("white", "black"):
+                nodes[game[side]] += game["nodes"][side]
+                seconds[game[side]] += game["seconds"][side]
+            if not args.json:
+                print(f"game {game['index'] + 1:>4}  {game['white']} - {game['black']}  {game['result']:7}  "
+                      f"{game['termination']}, {len(game['moves'])} plies")
+    elapsed = time.perf_counter() - start
+
+    if args.pgn:
+        games.sort(key=lambda game: game["index"])
+        with open(args.pgn, "w") as pgnFile:
+            pgnFile.write("\n".join(gamePgn(game) for game in games))
+
+    summary = {"engine": args.engine, "opponent": args.opponent, "games": args.games, "wins": wins, "draws": draws,
+               "losses": losses, "score": round((wins + draws / 2) / max(args.games, 1), 4),
+               "seconds": round(elapsed, 2),
+               "nps": {spec: int(nodes[spec] / seconds[spec]) if seconds[spec] > 0 else 0 for spec in nodes}}
+    if args.json:
+        print(json.dumps(summary))
+    else:
+        print(f"\n{args.engine} vs {args.opponent}: +{wins} ={draws} -{losses}  score {summary['score']:.3f}  "
+              f"in {elapsed:.1f}s")
+        for spec, nps in summary["nps"].items():
+            if nodes[spec]:
+                print(f"{spec}: {nodes[spec]} nodes, {nps} nps")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
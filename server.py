@@ -0,0 +1,242 @@
+# Asyncio game server for ChessAI: hosts many games at once over TCP, one per connection, and awaits the engine's
+# searches on a bounded process pool so the event loop never blocks on a search.
+# The protocol is one JSON object per line each way. Requests:
+#   {"cmd": "new", "fen": "...", "timeMs": 500}   start a game, both fields optional (default start position)
+#   {"cmd": "move", "move": "e2e4"}               play a move, the engine answers with its own
+#   {"cmd": "go"}                                  let the engine move for the side to move
+#   {"cmd": "quit"}
+# Every response has "ok", and "error" when it is false. Otherwise it has the fen, the legal moves in coordinate
+# notation and the result ("checkmate", "stalemate", ... or null), plus "engineMove" and "stats" when the engine moved.
+#
+#   python server.py                               localhost:8765, one search process per core
+#   python server.py --port 9000 -w 4 --max-sessions 500 --time-ms 200
+#
+# Every session has a time limit per engine move (timeMs), which is what its searches get. At most --max-pending
+# searches run at once (one per process by default); the sessions over that wait their turn, and while they wait
+# they don't read their socket, so their clients can't pile up more requests. A request that waits longer than
+# --queue-timeout for its turn is answered with a "busy" error instead.
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import ChessAI
+import ChessEngine
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_TIME_MS = 500
+MAX_TIME_MS = 10000
+DEFAULT_QUEUE_TIMEOUT = 10.0  # seconds a search may wait for a free process before the request gets "busy"
+SEARCH_GRACE = 1.0  # seconds a search may run over its time limit (depth 1 always finishes) before it is dropped
+DEFAULT_MAX_SESSIONS = 1000
+SEARCH_TABLE_MB = 8  # transposition table of each search process, shared by the games it searches
+
+searcher = None  # the Searcher of a pool process, see initSearchProcess
+
+
+def initSearchProcess(tableSizeMB, useBook):
+    global searcher
+    searcher = ChessAI.Searcher(ChessAI.TranspositionTable(tableSizeMB), workers=1, useBook=useBook, verbose=False)
+
+
+def searchPosition(fen, moves, time_ms):
+    """
+    Runs in a pool process: searches the position after playing the move codes from fen. The moves are sent
+    rather than just the final position so the search sees the game's repetitions. Returns (move code, stats)
+    """
+    gs = ChessEngine.GameState.from_fen(fen)
+    for move in moves:
+        gs.makeMoveCode(move)
+    stats = searcher.search(gs, gs.getValidMoves(), time_ms, ChessAI.MAX_PLY)
+    move = searcher.bestMove
+    return (None if move is None else move.code), stats.toDict()
+
+
+class RequestError(Exception):
+    pass
+
+
+class Session:
+    """
+    One game: the position it started from, the moves played since, and its time limit per engine move
+    """
+
+    def __init__(self, fen=ChessEngine.STARTING_FEN, time_ms=DEFAULT_TIME_MS):
+        self.gs = ChessEngine.GameState.from_fen(fen)
+        self.fen = fen
+        self.moves = []
+        self.time_ms = time_ms
+        self.validMoves = self.gs.getValidMoves()
+
+    def play(self, code) -> None:
+        self.gs.makeMoveCode(code)
+        self.moves.append(code)
+        self.validMoves = self.gs.getValidMoves()
+
+    def undo(self) -> None:
+        self.gs.undoMove()
+        self.moves.pop()
+        self.validMoves = self.gs.getValidMoves()
+
+    def result(self):
+        gs = self.gs
+        if gs.checkmate:
+            return "checkmate"
+        if gs.stalemate:
+            return "stalemate"
+        if gs.threefoldRepetition:
+            return "threefold repetition"
+        if gs.fiftyMoveRule:
+            return "fifty-move rule"
+        return None
+
+    def state(self) -> dict:
+        return {"ok": True, "fen": self.gs.to_fen(), "legal": [move.getChessNotation() for move in self.validMoves],
+                "result": self.result()}
+
+
+class GameServer:
+    def __init__(self, workers, maxSessions=DEFAULT_MAX_SESSIONS, maxPending=None, time_ms=DEFAULT_TIME_MS,
+                 queueTimeout=DEFAULT_QUEUE_TIMEOUT, useBook=True):
+        self.workers = workers
+        self.time_ms = time_ms  # time limit of a session that doesn't ask for one
+        self.queueTimeout = queueTimeout
+        self.maxSessions = maxSessions
+        self.maxPending = maxPending or workers  # more than workers queue up inside the pool, on their own clock
+        self.useBook = useBook
+        self.executor = None
+        self.searchSlots = None
+        self.sessions = 0
+        self.searches = 0
+        self.busy = 0
+
+    async def serve(self, host, port) -> None:
+        self.executor = ProcessPoolExecutor(self.workers, initializer=initSearchProcess,
+                                            initargs=(SEARCH_TABLE_MB, self.useBook))
+        self.searchSlots = asyncio.Semaphore(self.maxPending)
+        server = await asyncio.start_server(self.handleClient, host, port)
+        print(f"listening on {host}:{port}, {self.workers} search processes, at most {self.maxPending} searches "
+              f"at once and {self.maxSessions} sessions", flush=True)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.executor.shutdown(cancel_futures=True)
+
+    async def handleClient(self, reader, writer) -> None:
+        if self.sessions >= self.maxSessions:
+            writer.write(b'{"ok": false, "error": "too many sessions"}\n')
+            await writer.drain()
+            writer.close()
+            return
+        self.sessions += 1
+        session = Session(time_ms=self.time_ms)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise RequestError("requests are JSON objects")
+                    if request.get("cmd") == "quit":
+                        break
+                    session, response = await self.handle(session, request)
+                except (RequestError, ValueError) as error:
+                    response = {"ok": False, "error": str(error)}
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()  # don't read the next request while the client isn't reading responses
+        except ConnectionError:
+            pass
+        finally:
+            self.sessions -= 1
+            writer.close()
+
+    async def handle(self, session, request):
+        """
+        Runs one request. Returns the session (a new one after "new") and the response
+        """
+        command = request.get("cmd")
+        if command == "new":
+            fen = request.get("fen", ChessEngine.STARTING_FEN)
+            time_ms = request.get("timeMs", self.time_ms)
+            if not isinstance(fen, str):
+                raise RequestError("fen must be a string")
+            if not isinstance(time_ms, int) or isinstance(time_ms, bool) or not 0 < time_ms <= MAX_TIME_MS:
+                raise RequestError(f"timeMs must be 1-{MAX_TIME_MS}")
+            try:
+                newSession = Session(fen, time_ms)
+            except ValueError as error:
+                raise RequestError(f"bad fen: {error}") from None
+            return newSession, newSession.state()
+        if command == "move":
+            notation = request.get("move")
+            move = next((move for move in session.validMoves if move.getChessNotation() == notation), None)
+            if move is None:
+                raise RequestError(f"illegal move {notation}")
+            session.play(move.code)
+            if session.result() is not None:
+                return session, session.state()
+            try:
+                return session, await self.engineMove(session)
+            except RequestError:
+                session.undo()  # the engine never answered, so the move didn't happen either
+                raise
+        if command == "go":
+            if session.result() is not None:
+                raise RequestError("the game is over")
+            return session, await self.engineMove(session)
+        raise RequestError(f"unknown command {command}")
+
+    async def engineMove(self, session) -> dict:
+        loop = asyncio.get_running_loop()
+        try:
+            await asyncio.wait_for(self.searchSlots.acquire(), self.queueTimeout)
+        except asyncio.TimeoutError:
+            self.busy += 1
+            raise RequestError("busy")
+
+        future = self.executor.submit(searchPosition, session.fen, session.moves, session.time_ms)
+        # the slot is only free once the process is, even when the session has given up waiting for it
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self.searchSlots.release))
+        self.searches += 1
+        try:
+            code, stats = await asyncio.wait_for(asyncio.wrap_future(future), session.time_ms / 1000 + SEARCH_GRACE)
+        except asyncio.TimeoutError:
+            raise RequestError("search timed out")
+        if code is None:
+            raise RequestError("no move found")
+        session.play(code)
+        return session.state() | {"engineMove": ChessEngine.codeNotation(code), "stats": stats}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Asyncio game server for ChessAI")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1, help="search processes")
+    parser.add_argument("--max-sessions", type=int, default=DEFAULT_MAX_SESSIONS, help="connections served at once")
+    parser.add_argument("--max-pending", type=int, help="searches running at once (default one per process)")
+    parser.add_argument("--queue-timeout", type=float, default=DEFAULT_QUEUE_TIMEOUT,
+                        help="seconds a search may wait for a process before the request is answered busy")
+    parser.add_argument("--time-ms", type=int, default=DEFAULT_TIME_MS,
+                        help="time limit per engine move of sessions that don't set one")
+    parser.add_argument("--no-book", action="store_true", help="search every move, even in the opening book")
+    args = parser.parse_args(argv)
+    server = GameServer(args.workers, args.max_sessions, args.max_pending, args.time_ms, args.queue_timeout,
+                        not args.no_book)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    print(f"{server.searches} searches, {server.busy} busy answers")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
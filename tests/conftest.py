@@ -0,0 +1,24 @@
+# The modules live at the top of the repository, not in a package
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ChessEngine  # needs the path above
+
+
+def playMoves(gs, notations) -> None:
+    """
+    Plays moves given in coordinate notation (e2e4, e7e8q), then generates the legal moves of the position reached
+    so its checkmate, stalemate and draw flags are up to date
+    """
+    for notation in notations:
+        gs.makeMoveCode(next(code for code in gs.getLegalMoves() if ChessEngine.codeNotation(code) == notation))
+    gs.getLegalMoves()
+
+
+@pytest.fixture
+def play():
+    return playMoves
@@ -0,0 +1,44 @@
+import random
+
+import ChessEngine
+import perft
+
+
+def scannedAttackMap(gs, attacker) -> int:
+    """
+    attackMap the slow way, one square at a time, with the defending king left off the occupancy like attackMap does
+    """
+    defender = "b" if attacker == "w" else "w"
+    occupied = (gs.occupancy["w"] | gs.occupancy["b"]) & ~gs.bitboards[defender + "K"]
+    return sum(1 << sq for sq in range(64) if gs.isSquareAttacked(sq, attacker, occupied))
+
+
+def test_attack_maps_follow_make_and_undo():
+    rng = random.Random(0)
+    for name in ("kiwipete", "position3", "position4"):
+        gs = ChessEngine.GameState.from_fen(perft.POSITIONS[name][0])
+        for _ in range(40):
+            moves = gs.getLegalMoves()
+            if not moves:
+                break
+            before = gs.attackMap("w"), gs.attackMap("b")
+            gs.makeMoveCode(rng.choice(moves))
+            assert gs.whiteAttacks is None and gs.blackAttacks is None
+            assert gs.attackMap("w") == scannedAttackMap(gs, "w")
+            assert gs.attackMap("b") == scannedAttackMap(gs, "b")
+            # walk on from here every other move, otherwise check the undo restores the maps
+            if rng.random() < 0.5:
+                gs.undoMove()
+                assert gs.whiteAttacks is None and gs.blackAttacks is None
+                assert (gs.attackMap("w"), gs.attackMap("b")) == before
+                gs.makeMoveCode(rng.choice(moves))
+
+
+def test_in_check_uses_the_attack_map(play):
+    gs = ChessEngine.GameState()
+    play(gs, ["e2e4", "f7f6", "d2d4", "g7g5", "d1h5"])
+    assert gs.inCheck()
+    assert gs.getLegalMoves() == []
+    assert gs.checkmate
+    gs.undoMove()
+    assert not gs.inCheck()
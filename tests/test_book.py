@@ -0,0 +1,37 @@
+import ChessAI
+import ChessEngine
+import OpeningBook
+
+
+def test_start_position_is_in_the_book():
+    gs = ChessEngine.GameState()
+    legal = gs.getLegalMoves()
+    book = OpeningBook.OpeningBook(ChessAI.OPENING_BOOK_PATH)
+    try:
+        moves = book.probe(gs.zobristKey)
+        assert moves
+        assert all(move in legal and weight > 0 for move, weight in moves)
+        assert book.pickMove(gs.zobristKey, legal) in legal
+    finally:
+        book.close()
+
+
+def test_find_book_move_returns_a_legal_move():
+    gs = ChessEngine.GameState()
+    validMoves = gs.getValidMoves()
+    assert ChessAI.findBookMove(gs, validMoves) in validMoves
+
+
+def test_written_book_probes_back(tmp_path):
+    path = str(tmp_path / "book.bin")
+    weights = {(5, 100): 3, (5, 200): 7, (9, 300): 1}
+    assert OpeningBook.writeBook(path, weights) == 3
+    book = OpeningBook.OpeningBook(path)
+    try:
+        assert book.probe(5) == [(200, 7), (100, 3)]
+        assert book.probe(9) == [(300, 1)]
+        assert book.probe(7) == []
+        assert book.pickMove(5, [100]) == 100
+        assert book.pickMove(9, [100]) is None
+    finally:
+        book.close()
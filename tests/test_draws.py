@@ -0,0 +1,37 @@
+import ChessEngine
+
+
+def test_threefold_repetition(play):
+    gs = ChessEngine.GameState()
+    shuffle = ["g1f3", "g8f6", "f3g1", "f6g8"]
+    play(gs, shuffle)
+    assert gs.isRepetition()
+    assert not gs.threefoldRepetition
+    play(gs, shuffle[:3])
+    assert not gs.threefoldRepetition
+    play(gs, shuffle[3:])  # the start position for the third time
+    assert gs.threefoldRepetition
+    gs.undoMove()
+    gs.getLegalMoves()
+    assert not gs.threefoldRepetition
+
+
+def test_fifty_move_rule(play):
+    gs = ChessEngine.GameState.from_fen("4k3/8/8/8/8/8/4P3/R3K3 w - - 98 80")
+    play(gs, ["a1a2"])
+    assert gs.halfmoveClock == 99 and not gs.fiftyMoveRule
+    play(gs, ["e8d8"])
+    assert gs.fiftyMoveRule
+    gs.undoMove()
+    play(gs, [])
+    assert not gs.fiftyMoveRule
+
+
+def test_pawn_move_and_capture_reset_the_clock(play):
+    gs = ChessEngine.GameState.from_fen("4k3/8/8/3p4/8/8/4P3/4K3 w - - 40 60")
+    play(gs, ["e2e4"])
+    assert gs.halfmoveClock == 0
+    play(gs, ["e8e7", "e1e2", "d5e4"])
+    assert gs.halfmoveClock == 0
+    gs.undoMove()
+    assert gs.halfmoveClock == 2
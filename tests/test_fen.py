@@ -0,0 +1,46 @@
+import pytest
+
+import ChessEngine
+import perft
+
+
+@pytest.mark.parametrize("name", sorted(perft.POSITIONS))
+def test_fen_round_trip(name):
+    fen = perft.POSITIONS[name][0]
+    assert ChessEngine.GameState.from_fen(fen).to_fen() == fen
+
+
+def test_fen_matches_played_moves(play):
+    gs = ChessEngine.GameState()
+    play(gs, ["e2e4", "c7c5", "e4e5", "d7d5"])
+    fen = gs.to_fen()
+    assert fen == "rnbqkbnr/pp2pppp/8/2ppP3/8/8/PPPP1PPP/RNBQKBNR w KQkq d6 0 3"
+    fromFen = ChessEngine.GameState.from_fen(fen)
+    assert fromFen.zobristKey == gs.zobristKey
+    assert sorted(fromFen.getLegalMoves()) == sorted(gs.getLegalMoves())
+
+
+@pytest.mark.parametrize("fen", [
+    "4k3/8/8/8/8/8/8/4K3 w - z9 0 1",  # not a square
+    "4k3/8/8/8/8/8/8/4K3 w - e 0 1",
+    "4k3/8/8/8/8/8/8/4K3 w - e3 0 1",  # wrong rank for the side to move
+    "4k3/8/8/8/8/8/8/4K3 w - e6 0 1",  # no pawn that could have skipped it
+    "4k3/8/8/8/8/8/8/4K3 w X - 0 1",
+    "4k3/8/8/8/8/8/8/4K3 w KK - 0 1",
+    "4k3/8/8/8/8/8/8/P3K3 w - - 0 1",  # pawn on the first rank
+    "4k3/8/8/8/8/8/8/4K3 w - - x 1",
+    "4k3/8/8/8/8/8/8/4K3 w - - 0 0",
+    "4k3/8/8/8/8/8/8/8 w - - 0 1",  # no white king
+    "4k3/8/8/8/8/8/8/4K3 x - - 0 1",
+    "4k3/8/8/8/8/8/8 w - - 0 1",
+])
+def test_malformed_fen_raises_value_error(fen):
+    with pytest.raises(ValueError):
+        ChessEngine.GameState.from_fen(fen)
+
+
+def test_castling_rights_without_rook_are_dropped():
+    gs = ChessEngine.GameState.from_fen("4k3/8/8/8/8/8/8/4K3 w K - 0 1")
+    assert gs.castlingRights == 0
+    assert gs.to_fen() == "4k3/8/8/8/8/8/8/4K3 w - - 0 1"
+    assert "e1g1" not in [ChessEngine.codeNotation(code) for code in gs.getLegalMoves()]
@@ -0,0 +1,23 @@
+import pytest
+
+import ChessEngine
+import perft
+
+
+@pytest.mark.parametrize("name", sorted(perft.POSITIONS))
+def test_perft_counts(name):
+    fen, expectedCounts = perft.POSITIONS[name]
+    gs = ChessEngine.GameState.from_fen(fen)
+    key = gs.zobristKey
+    for depth in (2, 3):
+        assert gs.perft(depth) == expectedCounts[depth - 1], f"{name} at depth {depth}"
+    # every move made was taken back
+    assert gs.to_fen() == fen
+    assert gs.zobristKey == key
+
+
+def test_divide_adds_up_to_perft():
+    gs = ChessEngine.GameState.from_fen(perft.POSITIONS["kiwipete"][0])
+    counts = gs.divide(2)
+    assert len(counts) == perft.POSITIONS["kiwipete"][1][0]
+    assert sum(counts.values()) == perft.POSITIONS["kiwipete"][1][1]
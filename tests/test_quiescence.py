@@ -0,0 +1,19 @@
+import ChessAI
+import ChessEngine
+
+
+def test_delta_pruning_keeps_captures_that_promote():
+    # a queen down, but bxa8=Q wins a rook and makes a queen: a narrow window above the static score mustn't be
+    # pruned as if a queen capture were the most there is to win
+    gs = ChessEngine.GameState.from_fen("r5k1/1P6/8/8/7q/8/8/6K1 w - - 0 1")
+    searcher = ChessAI.Searcher(verbose=False)
+    fullWindow = searcher.quiescenceSearch(gs, -ChessAI.CHECKMATE, ChessAI.CHECKMATE, 1, 0)
+    assert fullWindow > -1
+    assert searcher.quiescenceSearch(gs, -1, 0, 1, 0) > -1
+
+
+def test_in_check_evasion_by_capture_is_searched():
+    # the only evasion that doesn't lose the queen is capturing the checker
+    gs = ChessEngine.GameState.from_fen("4k3/8/8/8/8/8/3q4/3QK3 w - - 0 1")
+    searcher = ChessAI.Searcher(verbose=False)
+    assert searcher.quiescenceSearch(gs, -ChessAI.CHECKMATE, ChessAI.CHECKMATE, 1, 0) >= 0
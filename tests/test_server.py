@@ -0,0 +1,68 @@
+import asyncio
+import json
+
+import pytest
+
+import server
+
+
+async def exchange(requests) -> list[dict]:
+    """
+    Sends the requests to a GameServer over a real connection and returns its responses
+    """
+    gameServer = server.GameServer(workers=1)
+    listener = await asyncio.start_server(gameServer.handleClient, "127.0.0.1", 0)
+    port = listener.sockets[0].getsockname()[1]
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    responses = []
+    try:
+        for request in requests:
+            writer.write(json.dumps(request).encode() + b"\n")
+            await writer.drain()
+            responses.append(json.loads(await asyncio.wait_for(reader.readline(), 5)))
+    finally:
+        writer.close()
+        listener.close()
+        await listener.wait_closed()
+    return responses
+
+
+def test_malformed_fen_gets_an_error_response():
+    responses = asyncio.run(exchange([
+        {"cmd": "new", "fen": "4k3/8/8/8/8/8/8/4K3 w - z9 0 1"},
+        {"cmd": "new", "fen": "4k3/8/8/8/8/8/8/4K3 w - e 0 1"},
+        {"cmd": "new", "fen": "not a fen"},
+        {"cmd": "new", "fen": "4k3/8/8/8/8/8/8/4K3 w - - 0 1"},
+    ]))
+    for response in responses[:3]:
+        assert response["ok"] is False
+        assert response["error"].startswith("bad fen")
+    # the connection and its session are still there
+    assert responses[3]["ok"] is True
+    assert responses[3]["fen"] == "4k3/8/8/8/8/8/8/4K3 w - - 0 1"
+
+
+def test_illegal_move_gets_an_error_response():
+    responses = asyncio.run(exchange([{"cmd": "move", "move": "e2e5"}, {"cmd": "bogus"}]))
+    assert responses == [{"ok": False, "error": "illegal move e2e5"}, {"ok": False, "error": "unknown command bogus"}]
+
+
+@pytest.mark.parametrize("time_ms", [True, False, 0, "500", 1.5])
+def test_bad_time_limit_is_rejected(time_ms):
+    responses = asyncio.run(exchange([{"cmd": "new", "timeMs": time_ms}]))
+    assert responses == [{"ok": False, "error": f"timeMs must be 1-{server.MAX_TIME_MS}"}]
+
+
+def test_move_is_taken_back_when_the_engine_cannot_answer():
+    async def busyMove():
+        gameServer = server.GameServer(workers=1, queueTimeout=0.01)
+        gameServer.searchSlots = asyncio.Semaphore(0)  # every search process taken
+        session = server.Session()
+        with pytest.raises(server.RequestError, match="busy"):
+            await gameServer.handle(session, {"cmd": "move", "move": "e2e4"})
+        return session
+
+    session = asyncio.run(busyMove())
+    assert session.moves == []
+    assert session.state()["fen"] == server.ChessEngine.STARTING_FEN
+    assert "e2e4" in session.state()["legal"]
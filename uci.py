@@ -0,0 +1,281 @@
+# UCI front end for ChessAI, for tournament managers and match servers that drive engines over stdin/stdout.
+# The search runs in a thread so "stop", "isready" and "quit" are answered while it thinks; "stop" aborts it at
+# the next node. "position" commands that only add moves to the previous one are applied incrementally.
+# After "go infinite" or "go ponder" the bestmove is held back until "stop" (or, pondering, the time left after
+# "ponderhit") even when the search ends by itself. A "go" without any limit (no clock for the side to move) is
+# taken as "go infinite".
+#
+#   python uci.py
+#
+# Supported: uci, isready, ucinewgame, setoption (Hash, Threads, OwnBook), position startpos|fen ... moves ...,
+# go movetime|depth|wtime|btime|winc|binc|movestogo|infinite|ponder, stop, ponderhit, quit
+
+import math
+import sys
+import threading
+from multiprocessing import RawValue
+
+import ChessAI
+import ChessEngine
+
+ENGINE_NAME = "ChessAI"
+ENGINE_AUTHOR = "AustinBao"
+DEFAULT_MOVES_TO_GO = 30  # moves a clock is budgeted over when the GUI doesn't say
+MOVE_OVERHEAD_MS = 50  # kept back from the clock for the lag between the engine and the GUI
+MAX_HASH_MB = 1024
+MAX_THREADS = 64
+
+
+class UciSearcher(ChessAI.Searcher):
+    """
+    Searcher that reports every completed iteration as a UCI info line
+    """
+
+    def __init__(self, output, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.output = output
+
+    def recordIteration(self, gs, depth, score, bestMove, stream):
+        super().recordIteration(gs, depth, score, bestMove, stream)
+        stats = self.stats
+        if stats.source != "search":
+            self.output(f"info string {stats.source} move")
+            return
+        pv = " ".join(ChessEngine.codeNotation(move) for move in stats.pv)
+        self.output(f"info depth {depth} seldepth {stats.seldepth} score {uciScore(score, len(stats.pv))} "
+                    f"nodes {stats.nodes + stats.helperNodes} nps {stats.nps} "
+                    f"time {int(stats.elapsed * 1000)} pv {pv}")
+
+
+def uciScore(score, pvLength) -> str:
+    """
+    A search score (pawns for the side to move) as "cp N" or "mate N", N in moves and negative when getting mated
+    """
+    if abs(score) >= ChessAI.CHECKMATE:  # a mate on the board, the line to it is the pv
+        plies = pvLength
+    elif abs(score) > ChessAI.TABLEBASE_WIN - 1:  # a tablebase win, see ChessAI.tablebaseScore
+        plies = round((ChessAI.TABLEBASE_WIN - abs(score)) * 1000)
+    else:
+        return f"cp {round(score * 100)}"
+    moves = max((plies + 1) // 2, 1)
+    return f"mate {moves if score > 0 else -moves}"
+
+
+def moveTime(gs, options) -> float:
+    """
+    Milliseconds to search for a "go" command: movetime as given, otherwise a share of the clock plus most of the
+    increment. math.inf when there is no limit
+    """
+    if "movetime" in options:
+        return max(options["movetime"] - MOVE_OVERHEAD_MS, 1)
+    clock = options.get("wtime" if gs.whiteToMove else "btime")
+    if clock is None:
+        return math.inf
+    increment = options.get("winc" if gs.whiteToMove else "binc", 0)
+    budget = clock / options.get("movestogo", DEFAULT_MOVES_TO_GO) + increment * 3 / 4
+    return max(min(budget, clock - MOVE_OVERHEAD_MS), 1)
+
+
+class UciEngine:
+    """
+    State of one UCI session: the game, the searcher and its options, and the search thread
+    """
+
+    def __init__(self, output=print):
+        self.output = output
+        self.lock = threading.Lock()  # output lines of the search thread and the command loop don't interleave
+        self.hashMB = ChessAI.TT_SIZE_MB
+        self.threads = 1
+        self.ownBook = True
+        self.stop = RawValue("b", 0)
+        self.release = threading.Event()  # set once the search thread may send its bestmove
+        self.ponderTime = None  # ms the search gets after "ponderhit" of a "go ponder"
+        self.ponderTimer = None
+        self.searcher = None
+        self.newSearcher()
+        self.gs = ChessEngine.GameState()
+        self.base = "startpos"
+        self.played = []  # move codes played from base
+        self.thread = None
+
+    def send(self, line) -> None:
+        with self.lock:
+            self.output(line)
+
+    def newSearcher(self) -> None:
+        self.searcher = UciSearcher(self.send, ChessAI.TranspositionTable(self.hashMB), self.threads, self.ownBook,
+                                    verbose=False)
+
+    def handle(self, line) -> bool:
+        """
+        Runs one command line. False once the engine should quit
+        """
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, arguments = tokens[0], tokens[1:]
+        if command == "uci":
+            self.send(f"id name {ENGINE_NAME}")
+            self.send(f"id author {ENGINE_AUTHOR}")
+            self.send(f"option name Hash type spin default {ChessAI.TT_SIZE_MB} min 1 max {MAX_HASH_MB}")
+            self.send(f"option name Threads type spin default 1 min 1 max {MAX_THREADS}")
+            self.send("option name OwnBook type check default true")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            self.stopSearch()
+            self.setOption(arguments)
+        elif command == "ucinewgame":
+            self.stopSearch()
+            self.newSearcher()  # a fresh transposition table
+        elif command == "position":
+            self.stopSearch()
+            self.setPosition(arguments)
+        elif command == "go":
+            self.stopSearch()
+            self.go(arguments)
+        elif command == "stop":
+            self.stopSearch()
+        elif command == "quit":
+            self.stopSearch()
+            return False
+        elif command == "ponderhit":
+            self.ponderHit()
+        elif command not in ("debug", "register"):
+            self.send(f"info string unknown command {command}")
+        return True
+
+    def setOption(self, arguments) -> None:
+        # setoption name <name> [value <value>], and the name may contain spaces
+        text = " ".join(arguments)
+        name, _, value = text.partition(" value ")
+        name = name.removeprefix("name ").strip().lower()
+        value = value.strip()
+        try:
+            if name == "hash":
+                self.hashMB = min(max(int(value), 1), MAX_HASH_MB)
+            elif name == "threads":
+                self.threads = min(max(int(value), 1), MAX_THREADS)
+            elif name == "ownbook":
+                self.ownBook = value.lower() == "true"
+            else:
+                self.send(f"info string unknown option {name}")
+                return
+        except ValueError:
+            self.send(f"info string bad value {value!r} for {name}")
+            return
+        self.newSearcher()
+
+    def setPosition(self, arguments) -> None:
+        """
+        position startpos|fen <fen> [moves ...]. When the base position is the same as last time and the move
+        list starts with the moves already played, only the difference is undone and played
+        """
+        if "moves" in arguments:
+            split = arguments.index("moves")
+            baseTokens, moves = arguments[:split], arguments[split + 1:]
+        else:
+            baseTokens, moves = arguments, []
+        if baseTokens[:1] == ["startpos"]:
+            base = "startpos"
+        elif baseTokens[:1] == ["fen"]:
+            base = " ".join(baseTokens[1:])
+        else:
+            self.send("info string position needs startpos or fen")
+            return
+
+        if base != self.base:
+            try:
+                gs = ChessEngine.GameState() if base == "startpos" else ChessEngine.GameState.from_fen(base)
+            except ValueError as error:
+                self.send(f"info string bad fen: {error}")
+                return
+            self.gs, self.base, self.played = gs, base, []
+        keep = 0
+        for played, move in zip(self.played, moves):
+            if ChessEngine.codeNotation(played) != move:
+                break
+            keep += 1
+        while len(self.played) > keep:
+            self.gs.undoMove()
+            self.played.pop()
+        for move in moves[keep:]:
+            code = next((code for code in self.gs.getLegalMoves() if ChessEngine.codeNotation(code) == move), None)
+            if code is None:
+                self.send(f"info string illegal move {move}")
+                return
+            self.gs.makeMoveCode(code)
+            self.played.append(code)
+
+    def go(self, arguments) -> None:
+        options = {}
+        for i, token in enumerate(arguments):
+            if token in ("movetime", "depth", "wtime", "btime", "winc", "binc", "movestogo") and \
+                    i + 1 < len(arguments) and arguments[i + 1].lstrip("-").isdigit():
+                options[token] = int(arguments[i + 1])
+        ponder = "ponder" in arguments
+        # nothing to stop the search but "stop": a bare "go", or a clock only for the other side
+        infinite = "infinite" in arguments or ("depth" not in options and not ponder and
+                                               moveTime(self.gs, options) == math.inf)
+        maxDepth = options.get("depth", ChessAI.MAX_PLY)
+        time_ms = math.inf if "depth" in options or infinite or ponder else moveTime(self.gs, options)
+        self.ponderTime = moveTime(self.gs, options) if ponder else None
+        self.searcher.infinite = infinite or ponder
+        self.stop.value = 0
+        if infinite or ponder:
+            self.release.clear()
+        else:
+            self.release.set()
+        self.thread = threading.Thread(target=self.search, args=(time_ms, maxDepth), daemon=True)
+        self.thread.start()
+
+    def search(self, time_ms, maxDepth) -> None:
+        validMoves = self.gs.getValidMoves()
+        if validMoves:
+            self.searcher.search(self.gs, validMoves, time_ms, maxDepth, self.stop)
+            move = self.searcher.bestMove
+            if move is None:  # stopped before depth 1 finished
+                move = validMoves[0]
+        self.release.wait()  # "go infinite" and "go ponder" answer only once stopped
+        self.send(f"bestmove {move.getChessNotation() if validMoves else '0000'}")
+
+    def ponderHit(self) -> None:
+        """
+        The opponent played the move pondered on: from now on the search has the time of a normal search
+        """
+        if self.thread is None or self.ponderTime is None:
+            return
+        if self.ponderTime == math.inf:  # no clock either, so it goes on like "go infinite"
+            self.ponderTime = None
+            return
+        self.ponderTimer = threading.Timer(self.ponderTime / 1000, self.endPonder)
+        self.ponderTimer.start()
+        self.ponderTime = None
+        self.release.set()
+
+    def endPonder(self) -> None:
+        self.stop.value = 1
+
+    def stopSearch(self) -> None:
+        if self.ponderTimer is not None:
+            self.ponderTimer.cancel()
+            self.ponderTimer = None
+        if self.thread is not None:
+            self.stop.value = 1
+            self.release.set()
+            self.thread.join()
+            self.thread = None
+
+
+def main() -> int:
+    engine = UciEngine(lambda line: print(line, flush=True))
+    for line in sys.stdin:
+        if not engine.handle(line):
+            break
+    engine.stopSearch()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())